@@ -1,4 +1,3 @@
-import json
 import time
 from pathlib import Path
 
@@ -6,10 +5,16 @@ import streamlit as st
 import yaml
 
 from core.fetcher import fetch_arxiv_source
-from core.parser import extract_frames, flatten_latex_tree
-from core.generator import fix_single_frame, generate_beamer_body
-from core.compiler import compile_latex
+from core.compactor import compact_paper
+from core.frames import FrameIndex
+from core.parser import flatten_latex_tree
+from core.generator import fix_frames, fix_single_frame, generate_beamer_body
+from core.autofix import auto_fix
+from core.compiler import CompileError, PreviewCompiler, compile_frame, compile_latex
+from core.localize import recover_deck, settings as recovery_settings
+from core.latex_log import frame_summary
 from utils.pdf_renderer import render_pdf_pages
+from utils.run_meta import update_run_meta
 
 
 # 多语言文本配置
@@ -26,6 +31,8 @@ TRANSLATIONS = {
         'template_help': 'Path to your Beamer template file',
         'run_name': 'Run Name',
         'run_help': 'Identifier for this run',
+        'use_llm_cache': 'Reuse cached LLM responses',
+        'llm_cache_help': 'Identical prompts return the stored response; untick to force fresh calls',
         'generate_btn': 'Generate Presentation',
         'config_tip': 'API key configured in config.yaml',
         'generation_log': 'Generation Log',
@@ -39,6 +46,7 @@ TRANSLATIONS = {
         'parse_failed': 'Parsing failed',
         'flattened': 'Flattened',
         'characters': 'characters',
+        'compacted': 'Compacted paper: {0:,} → {1:,} tokens',
         'generating': 'Generating Beamer content...',
         'generate_success': 'Beamer generated successfully',
         'generate_failed': 'Generation failed',
@@ -59,10 +67,39 @@ TRANSLATIONS = {
         'fixing': 'Fixing frame...',
         'fix_success': 'Frame fixed and recompiled successfully',
         'fix_failed': 'Fix failed:',
+        'batch_frames': 'Frames to fix in batch',
+        'batch_help': 'Selected frames are fixed concurrently and the deck is recompiled once',
+        'batch_fix': 'Batch Fix Frames',
+        'batch_fixing': 'Fixing {} frames...',
+        'batch_success': '{} frames fixed and recompiled',
+        'batch_partial': '{} of {} frames fixed and recompiled; the rest were left unchanged',
+        'layout_issues': 'LaTeX log reports layout problems on {} frame(s)',
+        'issue_overfull_vbox': 'content too tall by {:.1f}pt',
+        'issue_overfull_hbox': 'line too wide by {:.1f}pt',
+        'issue_underfull_vbox': 'underfull vbox (badness {})',
+        'issue_underfull_hbox': 'underfull line (badness {})',
+        'issue_missing_file': 'missing file',
+        'issue_error': 'error',
+        'issue_page': 'page {}',
+        'auto_fix_all': 'Auto Fix Until Clean',
+        'auto_fix_help': 'Compile, fix every frame the LaTeX log flags, and repeat until clean or the autofix budget runs out',
+        'auto_fixing': 'Auto-fixing the deck...',
+        'auto_iteration': 'Round {0}: compiled in {1:.1f}s, {2} problem frame(s)',
+        'auto_stop_clean': 'Deck is clean after {} round(s)',
+        'auto_stop_other': 'Auto fix stopped ({0}) after {1} round(s); {2} frame(s) still flagged',
+        'recovering': 'Compile failed, locating the broken frames...',
+        'recover_located': 'Broken frame(s) {0} found in {1} round(s), {2} compiles',
+        'recover_fixed': 'Fixed frame(s): {}',
+        'recover_quarantined': 'Replaced with placeholders (originals in quarantine/): {}',
+        'recover_preamble': 'The template preamble or the text between frames fails to compile:',
+        'recover_none': 'No single frame causes the failure',
+        'recover_done': 'Deck compiled after recovery',
         'enter_arxiv': 'Please enter an arXiv ID',
         'failed_fetch': 'Failed to fetch source:',
         'failed_parse': 'Failed to parse LaTeX:',
         'failed_llm': 'LLM call failed:',
+        'streamed_frames': 'Generating slides... {} frames so far',
+        'live_preview': 'Live preview · {} frames compiled',
         'failed_compile': 'LaTeX compilation failed:',
     },
     'zh': {
@@ -77,6 +114,8 @@ TRANSLATIONS = {
         'template_help': 'Beamer模板文件的路径',
         'run_name': '运行名称',
         'run_help': '本次运行的标识名称',
+        'use_llm_cache': '复用已缓存的LLM输出',
+        'llm_cache_help': '相同的提示词直接返回已保存的结果；取消勾选以强制重新调用',
         'generate_btn': '生成演示文稿',
         'config_tip': 'API密钥已在config.yaml中配置',
         'generation_log': '生成日志',
@@ -90,6 +129,7 @@ TRANSLATIONS = {
         'parse_failed': '解析失败',
         'flattened': '已扁平化',
         'characters': '个字符',
+        'compacted': '论文压缩：{0:,} → {1:,} tokens',
         'generating': '正在生成Beamer内容...',
         'generate_success': 'Beamer生成成功',
         'generate_failed': '生成失败',
@@ -110,10 +150,39 @@ TRANSLATIONS = {
         'fixing': '正在修复页面...',
         'fix_success': '页面已修复并重新编译',
         'fix_failed': '修复失败：',
+        'batch_frames': '批量修复的页面',
+        'batch_help': '所选页面并发修复，完成后只重新编译一次',
+        'batch_fix': '批量AI修复',
+        'batch_fixing': '正在修复 {} 页...',
+        'batch_success': '已修复 {} 页并重新编译',
+        'batch_partial': '已修复 {} / {} 页并重新编译，其余页面保持不变',
+        'layout_issues': 'LaTeX日志显示 {} 个页面存在排版问题',
+        'issue_overfull_vbox': '内容超出页面高度 {:.1f}pt',
+        'issue_overfull_hbox': '行超出宽度 {:.1f}pt',
+        'issue_underfull_vbox': '垂直盒子未填满（badness {}）',
+        'issue_underfull_hbox': '行未填满（badness {}）',
+        'issue_missing_file': '缺少文件',
+        'issue_error': '错误',
+        'issue_page': '第 {} 页',
+        'auto_fix_all': '自动修复直到无问题',
+        'auto_fix_help': '编译后修复日志中标出的所有页面，重复直到没有问题或用完 autofix 预算',
+        'auto_fixing': '正在自动修复整份幻灯片...',
+        'auto_iteration': '第 {0} 轮：编译用时 {1:.1f} 秒，{2} 个问题页面',
+        'auto_stop_clean': '经过 {} 轮后已无排版问题',
+        'auto_stop_other': '自动修复已停止（{0}），共 {1} 轮；仍有 {2} 个页面存在问题',
+        'recovering': '编译失败，正在定位出错的页面...',
+        'recover_located': '经过 {1} 轮、{2} 次编译定位到出错页面：{0}',
+        'recover_fixed': '已修复页面：{}',
+        'recover_quarantined': '已替换为占位页（原内容保存在 quarantine/）：{}',
+        'recover_preamble': '模板导言区或页面之间的内容无法编译：',
+        'recover_none': '无法将编译失败定位到单个页面',
+        'recover_done': '恢复后编译成功',
         'enter_arxiv': '请输入arXiv ID',
         'failed_fetch': '获取源码失败：',
         'failed_parse': 'LaTeX解析失败：',
         'failed_llm': 'LLM调用失败：',
+        'streamed_frames': '正在生成幻灯片... 已完成 {} 页',
+        'live_preview': '实时预览 · 已编译 {} 页',
         'failed_compile': 'LaTeX编译失败：',
     }
 }
@@ -124,6 +193,20 @@ def get_text(key: str, lang: str = 'en') -> str:
     return TRANSLATIONS.get(lang, TRANSLATIONS['en']).get(key, key)
 
 
+def describe_issue(issue, lang: str = 'en') -> str:
+    """把日志问题转成一句话描述"""
+    text = get_text(f'issue_{issue.kind}', lang)
+    if issue.overflow:
+        text = text.format(issue.points)
+    elif issue.kind.startswith('underfull'):
+        text = text.format(issue.badness)
+    else:
+        text = f'{text}: {issue.message}'
+    if issue.page is not None:
+        text = f'{text} · {get_text("issue_page", lang).format(issue.page)}'
+    return text
+
+
 def load_config(path: str) -> dict:
     with open(path, 'r', encoding='utf-8') as f:
         return yaml.safe_load(f)
@@ -500,6 +583,13 @@ def main() -> None:
             value=time.strftime('%Y%m%d_%H%M%S'),
             help=get_text('run_help', lang)
         )
+
+        # LLM输出缓存
+        cfg['llm']['cache'] = st.checkbox(
+            get_text('use_llm_cache', lang),
+            value=cfg['llm'].get('cache', True),
+            help=get_text('llm_cache_help', lang)
+        )
         
         st.markdown('')
         
@@ -522,6 +612,9 @@ def main() -> None:
         work_dir = workspace_root / run_name
         work_dir.mkdir(parents=True, exist_ok=True)
 
+        with right:
+            preview_slot = st.empty()
+
         with left:
             st.markdown(f'### {get_text("generation_log", lang)}')
             st.markdown('')
@@ -529,7 +622,7 @@ def main() -> None:
             # 步骤1: 获取源码
             with st.status(get_text('fetching', lang), expanded=True) as status:
                 try:
-                    src_dir = fetch_arxiv_source(arxiv_id, work_dir)
+                    src_dir = fetch_arxiv_source(arxiv_id, work_dir, cfg)
                     status.update(label=get_text('fetch_success', lang), state='complete')
                     st.success(f'{get_text("downloaded_to", lang)} `{src_dir}`')
                 except Exception as exc:
@@ -540,38 +633,108 @@ def main() -> None:
             # 步骤2: 解析LaTeX
             with st.status(get_text('parsing', lang), expanded=True) as status:
                 try:
-                    paper_tex = flatten_latex_tree(src_dir)
+                    paper_tex = flatten_latex_tree(src_dir, cfg)
+                    flat_chars = len(paper_tex)
+                    paper_tex, compaction = compact_paper(paper_tex, cfg, run_dir)
                     status.update(label=get_text('parse_success', lang), state='complete')
-                    st.success(f'{get_text("flattened", lang)} {len(paper_tex):,} {get_text("characters", lang)}')
+                    st.success(f'{get_text("flattened", lang)} {flat_chars:,} {get_text("characters", lang)}')
+                    st.info(get_text('compacted', lang).format(
+                        compaction['original_tokens'], compaction['final_tokens']))
                 except Exception as exc:
                     status.update(label=get_text('parse_failed', lang), state='error')
                     st.error(f'{get_text("failed_parse", lang)} {exc}')
                     return
 
-            # 步骤3: AI生成
+            # 步骤3: AI生成（流式输出，完成的frame立即写入talk.tex并在后台编译预览）
+            talk_tex = work_dir / 'talk.tex'
+            streamed = []
+            preview = None
+            if (cfg.get('generation') or {}).get('preview', True):
+                preview = PreviewCompiler(template_path, work_dir, cfg)
+            shown = {'version': 0}
+
+            def on_frame(frame: str) -> None:
+                streamed.append(frame)
+                partial = '\n'.join(['\\begin{document}', '\n\n'.join(streamed), '\\end{document}'])
+                talk_tex.write_text(partial, encoding='utf-8')
+                status.update(label=get_text('streamed_frames', lang).format(len(streamed)))
+                if preview is None:
+                    return
+                preview.submit(partial, len(streamed))
+                pdf, frames_done, version = preview.latest()
+                if version > shown['version']:
+                    shown['version'] = version
+                    try:
+                        page = render_pdf_pages(pdf, dpi=cfg['pdf']['render_dpi'], pages=[-1])[0]
+                    except Exception:
+                        return
+                    preview_slot.image(page, use_container_width=True,
+                                       caption=get_text('live_preview', lang).format(frames_done))
+
             with st.status(get_text('generating', lang), expanded=True) as status:
                 try:
-                    body_tex = generate_beamer_body(paper_tex, Path('assets/AGENTS.md'), cfg, run_dir)
+                    body_tex = generate_beamer_body(paper_tex, Path('assets/AGENTS.md'), cfg, run_dir, on_frame)
                     status.update(label=get_text('generate_success', lang), state='complete')
                     st.success(f'{get_text("generated", lang)} {len(body_tex):,} {get_text("characters", lang)}')
                 except Exception as exc:
                     status.update(label=get_text('generate_failed', lang), state='error')
                     st.error(f'{get_text("failed_llm", lang)} {exc}')
                     return
-                    
-            talk_tex = work_dir / 'talk.tex'
+                finally:
+                    if preview is not None:
+                        preview.close()
+                    preview_slot.empty()
+
             talk_tex.write_text(body_tex, encoding='utf-8')
 
             # 步骤4: 编译PDF
             with st.status(get_text('compiling', lang), expanded=True) as status:
                 try:
-                    pdf_path = compile_latex(talk_tex, template_path, work_dir, cfg)
+                    result = compile_latex(talk_tex, template_path, work_dir, cfg)
+                    pdf_path = result.pdf_path
+                    st.session_state['compile_issues'] = result.issues
                     status.update(label=get_text('compile_success', lang), state='complete')
                     st.success(f'{get_text("pdf_generated", lang)} `{pdf_path.name}`')
                 except Exception as exc:
+                    st.session_state['compile_issues'] = getattr(exc, 'issues', [])
                     status.update(label=get_text('compile_failed', lang), state='error')
                     st.error(f'{get_text("failed_compile", lang)} {exc}')
-                    return
+                    pdf_path = None
+                    compile_exc = exc
+                    if not isinstance(exc, CompileError) or recovery_settings(cfg)['recovery'] == 'off':
+                        return
+
+            # 编译失败时二分定位出错的页面，修复或替换为占位页后继续
+            if pdf_path is None:
+                with st.status(get_text('recovering', lang), expanded=True) as status:
+                    try:
+                        recovery = recover_deck(FrameIndex(body_tex), template_path, work_dir, run_dir, cfg,
+                                                Path('assets/AGENTS.md'))
+                    except Exception as exc:
+                        status.update(label=get_text('compile_failed', lang), state='error')
+                        st.error(f'{get_text("failed_compile", lang)} {exc}')
+                        return
+                    found = recovery.localization
+                    if found.preamble_error:
+                        status.update(label=get_text('compile_failed', lang), state='error')
+                        st.error(f'{get_text("recover_preamble", lang)} {found.preamble_error}')
+                        return
+                    if recovery.result is None:
+                        # 每一页单独都能编译，只有组合在一起才失败，无法归咎到某一页
+                        status.update(label=get_text('recover_none', lang), state='error')
+                        st.error(f'{get_text("failed_compile", lang)} {compile_exc}')
+                        return
+                    st.write(get_text('recover_located', lang).format(
+                        ', '.join(str(i + 1) for i in found.bad), found.rounds, found.compiles))
+                    if recovery.fixed:
+                        st.write(get_text('recover_fixed', lang).format(', '.join(str(i + 1) for i in recovery.fixed)))
+                    if recovery.quarantined:
+                        st.warning(get_text('recover_quarantined', lang).format(
+                            ', '.join(str(i + 1) for i in recovery.quarantined)))
+                    body_tex = recovery.frames.text()
+                    pdf_path = recovery.result.pdf_path
+                    st.session_state['compile_issues'] = recovery.result.issues
+                    status.update(label=get_text('recover_done', lang), state='complete')
 
             # 保存元数据
             meta = {
@@ -580,9 +743,11 @@ def main() -> None:
                 'run_name': run_name,
                 'timestamp': time.strftime('%Y-%m-%d %H:%M:%S')
             }
-            (run_dir / 'meta.json').write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+            # 合并写入，保留生成过程中记录的缓存计数
+            update_run_meta(run_dir, meta)
 
             st.session_state['body_tex'] = body_tex
+            st.session_state['frame_index'] = FrameIndex(body_tex)
             st.session_state['work_dir'] = str(work_dir)
             st.session_state['run_name'] = run_name
             st.session_state['pdf_path'] = str(pdf_path)
@@ -624,9 +789,21 @@ def main() -> None:
         st.markdown('---')
         with st.expander(get_text('fix_frame', lang), expanded=False):
             body_tex = st.session_state['body_tex']
-            frames = extract_frames(body_tex)
+            frames = st.session_state.get('frame_index')
+            if frames is None or frames.text() != body_tex:
+                frames = FrameIndex(body_tex)
+                st.session_state['frame_index'] = frames
             max_frame = max(len(frames), 1)
 
+            # 根据编译日志标出有排版问题的页面，无需渲染
+            problems = frame_summary(st.session_state.get('compile_issues', []))
+            problems = {i: v for i, v in problems.items() if i < len(frames)}
+            if problems:
+                st.warning(get_text('layout_issues', lang).format(len(problems)))
+                for i in sorted(problems):
+                    details = '; '.join(describe_issue(issue, lang) for issue in problems[i])
+                    st.markdown(f'- **{i + 1}. {frames.title(i) or "-"}** — {details}')
+
             col1, col2 = st.columns([1, 3])
             
             with col1:
@@ -634,12 +811,14 @@ def main() -> None:
                     get_text('frame_number', lang),
                     min_value=1,
                     max_value=max_frame,
-                    value=1,
+                    value=min(problems) + 1 if problems else 1,
                     help=get_text('frame_help', lang)
                 )
             
             with col2:
                 current_frame = frames[frame_index - 1] if frames else ''
+                for issue in problems.get(frame_index - 1, []):
+                    st.warning(describe_issue(issue, lang))
                 st.code(current_frame, language='latex', line_numbers=True)
 
             frame_text = st.text_area(
@@ -657,24 +836,30 @@ def main() -> None:
                         fixed = fix_single_frame(frame_text, Path('assets/AGENTS.md'), cfg, run_dir, frame_index)
                         fixed = fixed.replace('\\begin{document}', '').replace('\\end{document}', '').strip()
                         
-                        if frames:
-                            frames[frame_index - 1] = fixed
-                            new_body = body_tex
-                            if current_frame in new_body:
-                                new_body = new_body.replace(current_frame, fixed, 1)
-                            else:
-                                new_body = new_body.replace(frame_text, fixed, 1)
+                        old_frame = None
+                        if len(frames):
+                            # 按索引替换，避免重复frame时替换到错误位置
+                            if frames.replace(frame_index - 1, fixed) == 1:
+                                old_frame = current_frame
+                            new_body = frames.text()
                         else:
                             new_body = fixed
+                            frames = FrameIndex(new_body)
 
                         st.session_state['body_tex'] = new_body
+                        st.session_state['frame_index'] = frames
                         work_dir = Path(st.session_state['work_dir'])
                         talk_tex = work_dir / 'talk.tex'
                         talk_tex.write_text(new_body, encoding='utf-8')
 
-                        # 重新编译
-                        pdf_path = compile_latex(talk_tex, template_path, work_dir, cfg)
-                        st.session_state['pdf_path'] = str(pdf_path)
+                        # 只重新编译修改的帧并替换其页面；涉及跨帧状态时才完整编译
+                        result = None
+                        if old_frame is not None:
+                            result = compile_frame(frames, frame_index - 1, old_frame, template_path, work_dir, cfg)
+                        if result is None:
+                            result = compile_latex(talk_tex, template_path, work_dir, cfg)
+                        st.session_state['pdf_path'] = str(result.pdf_path)
+                        st.session_state['compile_issues'] = result.issues
 
                         st.success(get_text('fix_success', lang))
                         st.rerun()
@@ -682,6 +867,77 @@ def main() -> None:
                     except Exception as exc:
                         st.error(f'{get_text("fix_failed", lang)} {exc}')
 
+            # 自动修复循环：编译→检测→并发修复→重新编译，直到无问题或预算用完
+            if st.button(get_text('auto_fix_all', lang), use_container_width=True, help=get_text('auto_fix_help', lang)):
+                run_dir = runs_root / st.session_state.get('run_name', run_name)
+                work_dir = Path(st.session_state['work_dir'])
+
+                with st.status(get_text('auto_fixing', lang), expanded=True) as status:
+                    def on_iteration(record: dict) -> None:
+                        st.write(get_text('auto_iteration', lang).format(
+                            record['iteration'], record['compile_s'], len(record['problems'])))
+
+                    try:
+                        outcome = auto_fix(frames, template_path, work_dir, run_dir, cfg, Path('assets/AGENTS.md'),
+                                           on_iteration)
+                        st.session_state['body_tex'] = frames.text()
+                        st.session_state['frame_index'] = frames
+                        if outcome.result is not None:
+                            st.session_state['pdf_path'] = str(outcome.result.pdf_path)
+                            st.session_state['compile_issues'] = outcome.result.issues
+                        remaining = len(outcome.iterations[-1]['problems'])
+                        if outcome.clean:
+                            status.update(label=get_text('auto_stop_clean', lang).format(len(outcome.iterations)),
+                                          state='complete')
+                            st.rerun()
+                        else:
+                            status.update(label=get_text('auto_stop_other', lang).format(
+                                outcome.stop_reason, len(outcome.iterations), remaining), state='error')
+                            if outcome.error:
+                                st.error(f'{get_text("failed_compile", lang)} {outcome.error}')
+                    except Exception as exc:
+                        status.update(label=get_text('fix_failed', lang), state='error')
+                        st.error(f'{get_text("fix_failed", lang)} {exc}')
+
+            # 批量修复：并发调用LLM，一次性替换后只重新编译一次
+            st.markdown('---')
+            batch = st.multiselect(
+                get_text('batch_frames', lang),
+                options=list(range(1, len(frames) + 1)),
+                default=[i + 1 for i in sorted(problems) if any(issue.overflow for issue in problems[i])],
+                format_func=lambda n: f'{"⚠ " if n - 1 in problems else ""}{n}. {frames.title(n - 1) or "-"}',
+                help=get_text('batch_help', lang)
+            )
+
+            if st.button(get_text('batch_fix', lang), use_container_width=True, disabled=not batch):
+                run_dir = runs_root / st.session_state.get('run_name', run_name)
+
+                with st.spinner(get_text('batch_fixing', lang).format(len(batch))):
+                    try:
+                        results = fix_frames(frames, [n - 1 for n in batch], Path('assets/AGENTS.md'), cfg, run_dir)
+                        failed = [r for r in results if not r.ok]
+                        if len(failed) < len(results):
+                            new_body = frames.text()
+                            st.session_state['body_tex'] = new_body
+                            st.session_state['frame_index'] = frames
+                            work_dir = Path(st.session_state['work_dir'])
+                            talk_tex = work_dir / 'talk.tex'
+                            talk_tex.write_text(new_body, encoding='utf-8')
+                            result = compile_latex(talk_tex, template_path, work_dir, cfg)
+                            st.session_state['pdf_path'] = str(result.pdf_path)
+                            st.session_state['compile_issues'] = result.issues
+
+                        for r in failed:
+                            st.error(f'{get_text("frame_number", lang)} {r.index + 1}: {r.error}')
+                        if not failed:
+                            st.success(get_text('batch_success', lang).format(len(results)))
+                            st.rerun()
+                        elif len(failed) < len(results):
+                            st.warning(get_text('batch_partial', lang).format(len(results) - len(failed), len(results)))
+
+                    except Exception as exc:
+                        st.error(f'{get_text("fix_failed", lang)} {exc}')
+
     # 页脚
     st.markdown('---')
     st.markdown(
@@ -0,0 +1,71 @@
+"""Scaling benchmark for core.parser include flattening.
+
+Builds synthetic source trees with N included files (both a flat fan-out
+from the main file and a nested chain) and reports the flatten time per
+included file, which stays roughly constant when flattening is linear.
+
+    python -m benchmarks.bench_flatten [--sizes 10 100 1000] [--lines 200]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core import parser  # noqa: E402
+
+
+def _fragment(i: int, lines: int) -> str:
+    body = [f'Paragraph {i}.{j} with $x_{j}$ math and a % trailing comment' for j in range(lines)]
+    return '\n'.join([f'\\section{{Part {i}}}', '% a full-line comment', *body, ''])
+
+
+def build_tree(root: Path, n: int, lines: int, nested: bool) -> None:
+    (root / 'sections').mkdir(parents=True)
+    for i in range(n):
+        text = _fragment(i, lines)
+        if nested and i + 1 < n:
+            text += f'\\input{{sections/s{i + 1}}}\n'
+        (root / 'sections' / f's{i}.tex').write_text(text, encoding='utf-8')
+
+    includes = ['\\input{sections/s0}'] if nested else [f'\\input{{sections/s{i}}}' for i in range(n)]
+    (root / 'main.tex').write_text('\n'.join([
+        '\\documentclass{article}',
+        '\\begin{document}',
+        *includes,
+        '\\end{document}',
+        '',
+    ]), encoding='utf-8')
+
+
+def run(n: int, lines: int, nested: bool, repeat: int = 3) -> tuple:
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        build_tree(root, n, lines, nested)
+        best = float('inf')
+        for _ in range(repeat):
+            parser._STRIP_CACHE.clear()
+            start = time.perf_counter()
+            result = parser.resolve_latex_tree(root)
+            best = min(best, time.perf_counter() - start)
+        return best, len(result.text)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    ap.add_argument('--lines', type=int, default=200, help='lines per included file')
+    args = ap.parse_args()
+
+    print(f'{"layout":<8} {"files":>6} {"chars":>12} {"total ms":>10} {"us/file":>10}')
+    for nested in (False, True):
+        for n in args.sizes:
+            seconds, chars = run(n, args.lines, nested)
+            layout = 'nested' if nested else 'flat'
+            print(f'{layout:<8} {n:>6} {chars:>12,} {seconds * 1e3:>10.1f} {seconds * 1e6 / n:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
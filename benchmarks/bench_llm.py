@@ -0,0 +1,104 @@
+"""Offline load benchmark for the LLM layer using the ``mock`` provider.
+
+Runs the same batch of distinct fix prompts through the thread-pool path
+(``_call_llm``) and the asyncio path (``acall_many``) at several concurrency
+limits, then once more against a warm response cache. No API key or network
+is needed and the mock's pacing makes the numbers repeatable.
+
+    python -m benchmarks.bench_llm [--calls 64] [--concurrency 1 8 32] [--latency 0.2] [--tps 400]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core import generator  # noqa: E402
+
+
+def _prompts(n: int) -> list:
+    return [
+        generator._build_fix_prompt('Rules.', f'\\begin{{frame}}{{Slide {i}}}\n  Body {i}.\n\\end{{frame}}')
+        for i in range(n)
+    ]
+
+
+def _cfg(args, cache_root: str = '') -> dict:
+    return {
+        'llm': {
+            'provider': 'mock',
+            'model': 'mock',
+            'cache': bool(cache_root),
+            'mock': {'latency': args.latency, 'tokens_per_second': args.tps},
+            'retry': {'deadline': 60},
+        },
+        'cache': {'enabled': bool(cache_root), 'root': cache_root},
+    }
+
+
+def _timed(fn) -> tuple:
+    start = time.perf_counter()
+    latencies = fn()
+    return time.perf_counter() - start, latencies
+
+
+def run_threads(prompts: list, cfg: dict, workers: int) -> tuple:
+    def one(prompt):
+        start = time.perf_counter()
+        generator._call_llm(prompt, cfg)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return _timed(lambda: list(pool.map(one, prompts)))
+
+
+def run_async(prompts: list, cfg: dict, concurrency: int) -> tuple:
+    async def main():
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one(prompt):
+            async with limit:
+                start = time.perf_counter()
+                await generator.acall_llm(prompt, cfg)
+                return time.perf_counter() - start
+
+        return await asyncio.gather(*(one(p) for p in prompts))
+
+    return _timed(lambda: asyncio.run(main()))
+
+
+def _row(mode: str, n: int, conc: int, seconds: float, latencies: list) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    return (f'{mode:<12} {n:>6} {conc:>6} {seconds:>9.2f} {n / seconds:>9.1f} '
+            f'{statistics.median(latencies) * 1e3:>9.0f} {p95 * 1e3:>9.0f}')
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--calls', type=int, default=64)
+    ap.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    ap.add_argument('--latency', type=float, default=0.2, help='mock seconds to first token')
+    ap.add_argument('--tps', type=float, default=400, help='mock tokens per second')
+    args = ap.parse_args()
+
+    prompts = _prompts(args.calls)
+    print(f'{"mode":<12} {"calls":>6} {"conc":>6} {"wall s":>9} {"calls/s":>9} {"p50 ms":>9} {"p95 ms":>9}')
+    for conc in args.concurrency:
+        print(_row('threads', args.calls, conc, *run_threads(prompts, _cfg(args), conc)))
+        print(_row('asyncio', args.calls, conc, *run_async(prompts, _cfg(args), conc)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cfg = _cfg(args, tmp)
+        conc = max(args.concurrency)
+        print(_row('async cold', args.calls, conc, *run_async(prompts, cfg, conc)))
+        print(_row('async warm', args.calls, conc, *run_async(prompts, cfg, conc)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Unattended compile → detect → fix loop.
+
+Each iteration compiles the deck, takes the frames ``main.log`` reports as
+overflowing or broken (see :mod:`core.latex_log`), fixes them concurrently
+through :func:`core.generator.fix_frames` with the reported problems in the
+prompt, and compiles again. The loop stops when the deck is clean, after
+``autofix.max_iterations`` fix rounds, once ``autofix.time_budget`` seconds
+have passed, or when the remaining problem frames were already tried in
+exactly this form. Every iteration writes ``run_dir/autofix/iter_NN.json``
+(timings, problems, fix results) and ``iter_NN.diff`` (body changes).
+"""
+import difflib
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from core.compiler import CompileError, CompileResult, compile_latex
+from core.frames import FrameIndex
+from core.generator import fix_frames
+from utils.run_meta import update_run_meta
+
+
+DEFAULT_AUTOFIX = {
+    'max_iterations': 3,
+    'time_budget': 900.0,      # seconds for the whole loop
+    'min_points': 1.0,         # ignore overfull boxes smaller than this
+    'underfull': False,        # also fix underfull boxes
+}
+
+
+@dataclass
+class AutoFixResult:
+    frames: FrameIndex
+    result: Optional[CompileResult]
+    stop_reason: str           # clean, iterations, time_budget, no_progress, compile_error
+    iterations: list = field(default_factory=list)
+    error: str = ''
+
+    @property
+    def clean(self) -> bool:
+        return self.stop_reason == 'clean'
+
+
+def settings(cfg: dict) -> dict:
+    return {**DEFAULT_AUTOFIX, **(cfg.get('autofix') or {})}
+
+
+def problem_frames(issues: list, cfg: dict, frame_count: int) -> dict:
+    """``{frame: [issues]}`` for the frames worth sending to the fixer."""
+    opts = settings(cfg)
+    problems: dict = {}
+    for issue in issues:
+        if issue.frame is None or issue.frame >= frame_count:
+            continue
+        if issue.overflow:
+            wanted = issue.points >= float(opts['min_points'])
+        elif issue.kind.startswith('underfull'):
+            wanted = bool(opts['underfull'])
+        else:
+            wanted = True
+        if wanted:
+            problems.setdefault(issue.frame, []).append(issue)
+    return problems
+
+
+def _write_iteration(log_dir: Path, record: dict, diff: str = '') -> None:
+    name = f"iter_{record['iteration']:02d}"
+    (log_dir / f'{name}.json').write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding='utf-8')
+    if diff:
+        (log_dir / f'{name}.diff').write_text(diff, encoding='utf-8')
+
+
+def auto_fix(frames: FrameIndex, template_path: str, work_dir: Path, run_dir: Path, cfg: dict,
+             agents_path: Path, on_iteration: Optional[Callable[[dict], None]] = None) -> AutoFixResult:
+    """Compile and fix ``frames`` in place until the log is clean or a budget runs out.
+
+    ``on_iteration`` is called with each iteration's record as it is written.
+    The deck in ``frames`` and ``work_dir/talk.tex`` always hold the last
+    compiled body.
+    """
+    opts = settings(cfg)
+    start = time.monotonic()
+    log_dir = run_dir / 'autofix'
+    log_dir.mkdir(parents=True, exist_ok=True)
+    talk_tex = work_dir / 'talk.tex'
+    tried = set()
+    iterations = []
+    iteration = 0
+
+    while True:
+        iteration += 1
+        record = {'iteration': iteration, 'frames': len(frames)}
+
+        talk_tex.write_text(frames.text(), encoding='utf-8')
+        t0 = time.monotonic()
+        result = None
+        error = ''
+        try:
+            result = compile_latex(talk_tex, template_path, work_dir, cfg)
+            issues = result.issues
+        except CompileError as exc:
+            issues = exc.issues
+            error = str(exc)
+        record['compile_s'] = round(time.monotonic() - t0, 3)
+        record['compile_error'] = error
+
+        problems = problem_frames(issues, cfg, len(frames))
+        record['problems'] = {str(i + 1): [issue.message for issue in v] for i, v in sorted(problems.items())}
+        todo = [i for i in sorted(problems) if frames.frames[i].digest not in tried]
+
+        if not problems:
+            stop = 'compile_error' if error else 'clean'
+        elif iteration > int(opts['max_iterations']):
+            stop = 'iterations'
+        elif time.monotonic() - start >= float(opts['time_budget']):
+            stop = 'time_budget'
+        elif not todo:
+            stop = 'no_progress'
+        else:
+            stop = ''
+        if stop:
+            record['stop'] = stop
+            _write_iteration(log_dir, record)
+            iterations.append(record)
+            if on_iteration:
+                on_iteration(record)
+            break
+
+        before = frames.text()
+        tried.update(frames.frames[i].digest for i in todo)
+        t0 = time.monotonic()
+        notes = {i: [issue.message for issue in problems[i]] for i in todo}
+        fixes = fix_frames(frames, todo, agents_path, cfg, run_dir, notes)
+        record['fix_s'] = round(time.monotonic() - t0, 3)
+        record['fixed'] = [f.index + 1 for f in fixes if f.ok]
+        record['failed'] = {str(f.index + 1): f.error for f in fixes if not f.ok}
+
+        after = frames.text()
+        if after == before:
+            # Nothing changed, so recompiling would report the same problems.
+            record['stop'] = stop = 'no_progress'
+        diff = ''.join(difflib.unified_diff(before.splitlines(True), after.splitlines(True),
+                                            'talk.tex', 'talk.tex', n=2))
+        _write_iteration(log_dir, record, diff)
+        iterations.append(record)
+        if on_iteration:
+            on_iteration(record)
+        if stop:
+            break
+
+    update_run_meta(run_dir, {'autofix': {
+        'stop_reason': stop,
+        'iterations': iteration,
+        'elapsed_s': round(time.monotonic() - start, 3),
+        'remaining_problem_frames': len(problems),
+    }})
+    return AutoFixResult(frames, result, stop, iterations, error)
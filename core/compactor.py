@@ -0,0 +1,311 @@
+import json
+import re
+from pathlib import Path
+from typing import Optional
+
+
+DEFAULT_RULES = ['iffalse', 'comment_env', 'preamble', 'bibliography', 'figure_options', 'spacing']
+DEFAULT_BUDGET_RULES = ['appendix', 'long_tables', 'acknowledgments', 'truncate_sections']
+
+# Conditionals TeX counts while skipping an \iffalse branch: the primitives,
+# common package switches and anything declared with \newif in the paper.
+# Macros such as \ifthenelse or etoolbox's \ifdefstring have no \fi.
+TEX_CONDITIONALS = {
+    'if', 'ifcat', 'ifnum', 'ifdim', 'ifodd', 'ifvmode', 'ifhmode', 'ifmmode', 'ifinner', 'ifvoid',
+    'ifhbox', 'ifvbox', 'ifx', 'ifeof', 'iftrue', 'iffalse', 'ifcase', 'ifdefined', 'ifcsname',
+    'iffontchar', 'ifincsname', 'ifpdf', 'ifxetex', 'ifluatex', 'ifpdftex',
+}
+NEWIF_RE = re.compile(r'\\newif\s*\\(if[A-Za-z@]+)')
+CONDITIONAL_TOKEN_RE = re.compile(
+    r'\\newif\s*\\if[A-Za-z@]*'
+    r'|\\(?P<name>if[A-Za-z@]*|fi(?![A-Za-z@])|else(?![A-Za-z@]))'
+    r'|\\.'
+    r'|%[^\n]*',
+    re.DOTALL,
+)
+COMMENT_ENV_RE = re.compile(r'\\begin\{comment\}.*?\\end\{comment\}', re.DOTALL)
+BIB_ENV_RE = re.compile(r'\\begin\{thebibliography\}.*?\\end\{thebibliography\}', re.DOTALL)
+BIB_CMD_RE = re.compile(r'\\(?:bibliography|bibliographystyle|addbibresource)\s*\{[^}]*\}|\\printbibliography(?:\[[^\]]*\])?')
+FLOAT_OPTS_RE = re.compile(r'(\\begin\{(?:figure|table|wrapfigure|figure\*|table\*)\})\s*\[[^\]]*\]')
+GRAPHICS_OPTS_RE = re.compile(r'(\\includegraphics\*?)\s*\[[^\]]*\]')
+SPACING_RE = re.compile(
+    r'\\(?:vspace|hspace)\*?\s*\{[^}]*\}'
+    r'|\\(?:centering|noindent|smallskip|medskip|bigskip|clearpage|newpage|pagebreak|FloatBarrier)(?![A-Za-z@])'
+)
+APPENDIX_RE = re.compile(r'\\appendix(?![A-Za-z@])')
+ACK_RE = re.compile(
+    r'\\(?:section|subsection)\*?\s*\{\s*Acknowledge?ments?\s*\}.*?(?=\\(?:section|appendix|end\{document\})|\Z)'
+    r'|\\begin\{ack(?:s|nowledge?ments?)?\}.*?\\end\{ack(?:s|nowledge?ments?)?\}',
+    re.DOTALL | re.IGNORECASE,
+)
+TABULAR_RE = re.compile(r'(\\begin\{(tabular\*?|tabularx|longtable)\}.*?\\end\{\2\})', re.DOTALL)
+SECTION_RE = re.compile(r'\\section\*?\s*\{')
+DEFINITION_RE = re.compile(
+    r'\\(?:newcommand|renewcommand|providecommand|DeclareMathOperator)\*?\s*\{?\\([A-Za-z@]+)\}?'
+    r'|\\def\s*\\([A-Za-z@]+)'
+)
+DEF_PARAMS_RE = re.compile(r'\s*(?:\[[^\]]*\]|#\d)*')
+TRUNCATED_MARK = '\n[... section truncated ...]\n'
+KEEP_PREAMBLE_RE = re.compile(r'\\(?:title|author)\s*(?:\[[^\]]*\])?\s*\{')
+
+
+def count_tokens(text: str, cfg: Optional[dict] = None) -> tuple:
+    """Count tokens for the configured model; returns ``(tokens, method)``.
+
+    Uses ``tiktoken`` when it is installed. Anthropic and DeepSeek use their
+    own tokenizers, for which cl100k is a close enough proxy to size a
+    prompt. Without ``tiktoken`` a characters-per-token estimate is used.
+    """
+    llm = (cfg or {}).get('llm') or {}
+    try:
+        import tiktoken
+    except ImportError:
+        ratio = ((cfg or {}).get('compaction') or {}).get('chars_per_token', 3.6)
+        return int(len(text) / ratio) + 1, f'estimate:{ratio}'
+
+    try:
+        enc = tiktoken.encoding_for_model(llm.get('model', ''))
+    except KeyError:
+        enc = tiktoken.get_encoding('cl100k_base')
+    return len(enc.encode(text, disallowed_special=())), f'tiktoken:{enc.name}'
+
+
+def _match_brace(text: str, open_pos: int) -> int:
+    depth = 0
+    for i in range(open_pos, len(text)):
+        ch = text[i]
+        if ch == '{' and (i == 0 or text[i - 1] != '\\'):
+            depth += 1
+        elif ch == '}' and text[i - 1] != '\\':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(text)
+
+
+def _split_document(text: str) -> tuple:
+    idx = text.find('\\begin{document}')
+    if idx < 0:
+        return '', text
+    return text[:idx], text[idx:]
+
+
+def _rule_iffalse(text: str, cfg: dict) -> str:
+    """Drop ``\\iffalse ... \\fi`` blocks, keeping an ``\\else`` branch.
+
+    Nested conditionals are matched by depth like TeX does, so an inner
+    ``\\if ... \\fi`` does not end the block early. An unterminated
+    ``\\iffalse`` is left alone.
+    """
+    conditionals = TEX_CONDITIONALS | set(NEWIF_RE.findall(text))
+    out = []
+    last = 0
+    start = depth = None
+    else_end = None
+    for m in CONDITIONAL_TOKEN_RE.finditer(text):
+        name = m.group('name')
+        if name is None:
+            continue
+        if start is None:
+            if name == 'iffalse':
+                start, depth, else_end = m.start(), 1, None
+        elif name == 'fi':
+            depth -= 1
+            if depth == 0:
+                out.append(text[last:start])
+                if else_end is not None:
+                    out.append(text[else_end:m.start()])
+                last = m.end()
+                start = None
+        elif name == 'else':
+            if depth == 1 and else_end is None:
+                else_end = m.end()
+        elif name in conditionals:
+            depth += 1
+    out.append(text[last:])
+    return ''.join(out)
+
+
+def _rule_comment_env(text: str, cfg: dict) -> str:
+    return COMMENT_ENV_RE.sub('', text)
+
+
+def _rule_preamble(text: str, cfg: dict) -> str:
+    """Replace the preamble with \\title/\\author and the macros the body uses."""
+    preamble, body = _split_document(text)
+    if not preamble:
+        return text
+
+    used = set(re.findall(r'\\([A-Za-z@]+)', body))
+    kept = []
+    for match in KEEP_PREAMBLE_RE.finditer(preamble):
+        kept.append(preamble[match.start():_match_brace(preamble, match.end() - 1)])
+    for match in DEFINITION_RE.finditer(preamble):
+        pos = match.end()
+        while True:
+            params = DEF_PARAMS_RE.match(preamble, pos)
+            if params is None or params.end() == pos:
+                break
+            pos = params.end()
+        end = _match_brace(preamble, pos) if preamble.startswith('{', pos) else pos
+        if (match.group(1) or match.group(2)) in used:
+            kept.append(preamble[match.start():end].strip())
+    return '\n'.join(kept + [body])
+
+
+def _rule_bibliography(text: str, cfg: dict) -> str:
+    return BIB_CMD_RE.sub('', BIB_ENV_RE.sub('', text))
+
+
+def _rule_figure_options(text: str, cfg: dict) -> str:
+    return GRAPHICS_OPTS_RE.sub(r'\1', FLOAT_OPTS_RE.sub(r'\1', text))
+
+
+def _rule_spacing(text: str, cfg: dict) -> str:
+    return re.sub(r'\n{3,}', '\n\n', SPACING_RE.sub('', text))
+
+
+def _rule_appendix(text: str, cfg: dict) -> str:
+    match = APPENDIX_RE.search(text)
+    if match is None:
+        return text
+    end = text.find('\\end{document}', match.end())
+    return text[:match.start()] + (text[end:] if end >= 0 else '')
+
+
+def _rule_acknowledgments(text: str, cfg: dict) -> str:
+    return ACK_RE.sub('', text)
+
+
+def _rule_long_tables(text: str, cfg: dict) -> str:
+    max_rows = int(cfg.get('max_table_rows', 12))
+
+    def shorten(match):
+        table = match.group(1)
+        rows = table.split('\\\\')
+        if len(rows) <= max_rows + 1:
+            return table
+        kept = rows[:max_rows]
+        omitted = len(rows) - max_rows - 1
+        return '\\\\'.join(kept) + f'\\\\\n[... {omitted} more rows omitted ...]\n' + rows[-1]
+
+    return TABULAR_RE.sub(shorten, text)
+
+
+def _rule_truncate_sections(text: str, cfg: dict, budget_chars: int) -> str:
+    """Trim every section proportionally so the text fits ``budget_chars``.
+
+    Each section keeps at least its first 400 characters unless those
+    floors alone would overshoot the budget (many short sections); then
+    only the section headings are guaranteed.
+    """
+    starts = [m.start() for m in SECTION_RE.finditer(text)]
+    if not starts or len(text) <= budget_chars:
+        return text[:budget_chars] if len(text) > budget_chars else text
+
+    bounds = starts + [len(text)]
+    head = text[:starts[0]]
+    sections = [text[a:b] for a, b in zip(bounds, bounds[1:])]
+    total = sum(len(s) for s in sections)
+    available = max(0, budget_chars - len(head) - len(TRUNCATED_MARK) * len(sections))
+
+    def fit(floor) -> str:
+        trimmed = []
+        for section in sections:
+            keep = max(int(available * len(section) / total), min(len(section), floor(section)))
+            if keep < len(section):
+                section = section[:keep].rstrip() + TRUNCATED_MARK
+            trimmed.append(section)
+        return head + ''.join(trimmed)
+
+    result = fit(lambda section: 400)
+    if len(result) > budget_chars:
+        result = fit(lambda section: _match_brace(section, SECTION_RE.match(section).end() - 1))
+    return result
+
+
+RULES = {
+    'iffalse': _rule_iffalse,
+    'comment_env': _rule_comment_env,
+    'preamble': _rule_preamble,
+    'bibliography': _rule_bibliography,
+    'figure_options': _rule_figure_options,
+    'spacing': _rule_spacing,
+    'appendix': _rule_appendix,
+    'acknowledgments': _rule_acknowledgments,
+    'long_tables': _rule_long_tables,
+}
+
+
+def compact_paper(paper_tex: str, cfg: dict, run_dir: Optional[Path] = None) -> tuple:
+    """Shrink the flattened paper before it is pasted into the prompt.
+
+    ``compaction.rules`` always run. ``compaction.budget_rules`` run in
+    order only while the paper is still above ``compaction.target_tokens``;
+    ``truncate_sections`` is the last resort. Returns ``(text, report)`` and
+    writes the report to ``run_dir/compaction.json``.
+    """
+    comp_cfg = cfg.get('compaction') or {}
+    original_tokens, method = count_tokens(paper_tex, cfg)
+    report = {
+        'method': method,
+        'target_tokens': comp_cfg.get('target_tokens'),
+        'original_chars': len(paper_tex),
+        'original_tokens': original_tokens,
+        'steps': [],
+    }
+    if not comp_cfg.get('enabled', True):
+        report['enabled'] = False
+        report['final_chars'], report['final_tokens'] = len(paper_tex), original_tokens
+        target = int(comp_cfg.get('target_tokens') or 0)
+        report['within_budget'] = not target or original_tokens <= target
+        _write_report(run_dir, report)
+        return paper_tex, report
+
+    text = paper_tex
+    tokens = original_tokens
+    target = int(comp_cfg.get('target_tokens') or 0)
+
+    def apply(name: str) -> None:
+        nonlocal text, tokens
+        if name == 'truncate_sections':
+            budget_chars = int(len(text) * target / tokens * 0.97) if tokens else len(text)
+            new_text = _rule_truncate_sections(text, comp_cfg, budget_chars)
+        elif name in RULES:
+            new_text = RULES[name](text, comp_cfg)
+        else:
+            raise ValueError(f'Unknown compaction rule: {name}')
+        if new_text == text:
+            return
+        new_tokens, _ = count_tokens(new_text, cfg)
+        report['steps'].append({
+            'rule': name,
+            'chars_removed': len(text) - len(new_text),
+            'tokens_removed': tokens - new_tokens,
+        })
+        text, tokens = new_text, new_tokens
+
+    for name in comp_cfg.get('rules', DEFAULT_RULES):
+        apply(name)
+    for name in comp_cfg.get('budget_rules', DEFAULT_BUDGET_RULES):
+        # Token counts are not proportional to characters, so truncation
+        # may need a couple of rounds to land inside the budget.
+        for _ in range(3 if name == 'truncate_sections' else 1):
+            if not target or tokens <= target:
+                break
+            apply(name)
+
+    report['final_chars'] = len(text)
+    report['final_tokens'] = tokens
+    report['within_budget'] = not target or tokens <= target
+    if not report['within_budget']:
+        report['over_budget_tokens'] = tokens - target
+
+    _write_report(run_dir, report)
+    return text, report
+
+
+def _write_report(run_dir: Optional[Path], report: dict) -> None:
+    if run_dir:
+        run_dir.mkdir(parents=True, exist_ok=True)
+        (run_dir / 'compaction.json').write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
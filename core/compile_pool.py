@@ -0,0 +1,153 @@
+"""Shared LaTeX process runner.
+
+Every compile in the process goes through one bounded pool
+(``latex.max_workers`` slots) so several sessions on the same server queue
+instead of oversubscribing the CPUs. Waiting jobs are served round-robin by
+owner (one owner per run workspace), so a user with many queued compiles
+cannot starve the others. Each TeX process gets a wall-clock deadline
+(``latex.timeout``), is killed together with its children when it runs
+over, and on Linux gets an address-space limit (``latex.max_memory_mb``)
+applied right after it starts.
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+
+DEFAULT_LATEX = {
+    'max_workers': max(1, (os.cpu_count() or 2) // 2),
+    'timeout': 180.0,
+    'max_memory_mb': 4096,
+}
+
+# Module-level so the pool is shared by every Streamlit session.
+_SLOTS = None
+_SLOTS_LOCK = threading.Lock()
+
+
+class CompileTimeout(RuntimeError):
+    pass
+
+
+class CompileSlots:
+    """At most ``size`` jobs at once; waiters are admitted round-robin by owner."""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._running = 0
+        self._queues: dict = {}
+        self._order = deque()
+        self._cond = threading.Condition()
+
+    def _head(self):
+        return self._queues[self._order[0]][0] if self._order else None
+
+    @contextmanager
+    def slot(self, owner: str):
+        ticket = object()
+        with self._cond:
+            if owner not in self._queues:
+                self._queues[owner] = deque()
+                self._order.append(owner)
+            self._queues[owner].append(ticket)
+            while self._running >= self.size or self._head() is not ticket:
+                self._cond.wait()
+            self._queues[owner].popleft()
+            self._order.popleft()
+            if self._queues[owner]:
+                # Owner goes to the back of the line for its next job.
+                self._order.append(owner)
+            else:
+                del self._queues[owner]
+            self._running += 1
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def waiting(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._queues.values())
+
+
+def latex_settings(cfg: dict) -> dict:
+    latex = cfg.get('latex') or {}
+    return {k: latex.get(k, v) for k, v in DEFAULT_LATEX.items()}
+
+
+def compile_slots(cfg: dict) -> CompileSlots:
+    global _SLOTS
+    with _SLOTS_LOCK:
+        if _SLOTS is None:
+            _SLOTS = CompileSlots(int(latex_settings(cfg)['max_workers']))
+        return _SLOTS
+
+
+def _limit_memory(proc: subprocess.Popen, cfg: dict) -> None:
+    """Cap the address space of a started TeX process.
+
+    Compiles are spawned from several threads at once, where ``preexec_fn``
+    can deadlock the child before exec, so the limit is set from the
+    parent with ``prlimit`` instead. Only Linux has it; elsewhere only the
+    wall-clock limit applies.
+    """
+    max_mb = latex_settings(cfg)['max_memory_mb']
+    if not max_mb:
+        return
+    try:
+        import resource
+        max_bytes = int(max_mb) * 1024 * 1024
+        resource.prlimit(proc.pid, resource.RLIMIT_AS, (max_bytes, max_bytes))
+    except (ImportError, AttributeError, OSError, ValueError):
+        # No prlimit here, or the process already exited.
+        pass
+
+
+def _spawn_kwargs() -> dict:
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def _kill_tree(proc: subprocess.Popen) -> None:
+    """Kill ``proc`` and everything it started (latexmk runs the engine as a child)."""
+    if os.name == 'nt':
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(proc.pid)],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except OSError:
+        proc.kill()
+
+
+def run_latex(cmd: list, cwd: Path, env: dict, cfg: dict, deadline: Optional[float] = None) -> tuple:
+    """Run one TeX command; returns ``(stdout, stderr)`` bytes.
+
+    Raises :class:`subprocess.CalledProcessError` on a non-zero exit and
+    :class:`CompileTimeout` once ``deadline`` (a ``time.monotonic()`` value,
+    default ``latex.timeout`` from now) passes.
+    """
+    timeout = float(latex_settings(cfg)['timeout'])
+    deadline = deadline or time.monotonic() + timeout
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+                            **_spawn_kwargs())
+    _limit_memory(proc, cfg)
+    try:
+        stdout, stderr = proc.communicate(timeout=max(0.0, deadline - time.monotonic()))
+    except subprocess.TimeoutExpired:
+        _kill_tree(proc)
+        proc.communicate()
+        raise CompileTimeout(f'LaTeX compile timed out after {timeout:g}s')
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return stdout, stderr
@@ -1,44 +1,543 @@
+import json
 import subprocess
 import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Optional
+
+from core.figures import prepare_figures
+from core.compile_pool import CompileTimeout, compile_slots, latex_settings, run_latex
+from core.frames import FrameIndex
+from core.latex_log import assign_frames, load_issues, parse_log, write_issues
+from utils.disk_cache import file_sha256, hash_key, memo_file_sha256, open_cache
+from utils.pdf_renderer import page_count, replace_pdf_pages
+
+
+FORMAT_VERSION = 1
+PREAMBLE_JOB = 'koda-preamble'
+# Errors that mean the precompiled format, not the body, is at fault.
+FORMAT_ERROR_RE = re.compile(r'format file|\.fmt\b|mylatexformat|endofdump', re.IGNORECASE)
+
+COMPILE_CACHE_VERSION = 1
+# Outputs restored on a compile-cache hit; .aux/.nav keep the page map and
+# single-frame compiles working.
+COMPILE_OUTPUTS = ('main.pdf', 'main.log', 'main.aux', 'main.nav')
+ASSET_RE = re.compile(
+    r'\\(includegraphics|input|include|lstinputlisting|bibliography|addbibresource)\*?'
+    r'\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}'
+)
+ASSET_EXTS = {
+    'includegraphics': ('', '.pdf', '.png', '.jpg', '.jpeg', '.eps'),
+    'input': ('', '.tex'),
+    'include': ('.tex',),
+    'bibliography': ('.bib',),
+}
+# Files whose change between passes means references/TOC/navigation are
+# not settled yet and another pass is needed.
+RERUN_EXTS = ('aux', 'toc', 'nav', 'out', 'snm')
+PAGE_MAP_NAME = 'page_map.json'
+FRAMEPAGES_RE = re.compile(r'\\beamer@framepages\s*\{(\d+)\}\s*\{(\d+)\}')
+# Frame content whose change affects other frames (labels, counters,
+# numbering options); such edits need a full compile.
+CROSS_FRAME_RE = re.compile(
+    r'\\label\s*\{[^}]*\}|\\(?:set|addto|step|refstep)counter\s*\{[^}]*\}|\\againframe'
+    r'|\\(?:sub){0,2}section(?![A-Za-z@])|label=[^,\]]*|noframenumbering|allowframebreaks'
+)
+FRAME_OPTIONS_RE = re.compile(r'\\begin\s*\{frame\*?\}\s*(?:<[^>]*>\s*)?(?:\[([^\]]*)\])?')
+
+_ENGINE_VERSIONS: dict = {}
+_FORMAT_LOCK = threading.Lock()
+
+
+@dataclass
+class CompileResult:
+    pdf_path: Path
+    issues: list = field(default_factory=list)  # core.latex_log.LogIssue items
+    passes: int = 0
+    cached: bool = False
+
+
+class CompileError(RuntimeError):
+    def __init__(self, message: str, issues: Optional[list] = None):
+        super().__init__(message)
+        self.issues = issues or []
 
 
 def _run(cmd, cwd: Path) -> None:
     subprocess.run(cmd, cwd=cwd, check=True)
 
 
-def compile_latex(talk_tex: Path, template_path: str, work_dir: Path, cfg: dict) -> Path:
-    if not template_path:
-        raise ValueError('Template path is required')
+def _latex_env(cfg: dict) -> dict:
+    env = os.environ.copy()
+    if 'bin_path' in cfg.get('latex', {}):
+        bin_path = str(Path(cfg['latex']['bin_path']).resolve())
+        env['PATH'] = f"{bin_path}{os.pathsep}{env['PATH']}"
+    return env
 
-    template = Path(template_path).read_text(encoding='utf-8', errors='ignore')
-    body = talk_tex.read_text(encoding='utf-8', errors='ignore')
 
-    out_tex = work_dir / 'main.tex'
-    out_tex.write_text(template + '\n' + body, encoding='utf-8')
+def _engine(cfg: dict) -> Optional[str]:
+    """TeX engine behind ``latex.compiler``; None when it cannot use a format."""
+    compiler = cfg['latex']['compiler']
+    if compiler == 'latexmk':
+        return 'xelatex'
+    if compiler == 'pdflatex':
+        return 'pdflatex'
+    return None
+
+
+def _engine_version(engine: str, env: dict) -> str:
+    key = (engine, env.get('PATH', ''))
+    if key not in _ENGINE_VERSIONS:
+        try:
+            out = subprocess.run([engine, '--version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 env=env, timeout=30).stdout
+            _ENGINE_VERSIONS[key] = out.decode('utf-8', errors='ignore').splitlines()[0].strip()
+        except (OSError, IndexError, subprocess.SubprocessError):
+            _ENGINE_VERSIONS[key] = ''
+    return _ENGINE_VERSIONS[key]
+
+
+def _place_file(src: Path, dst: Path) -> None:
+    if dst.exists():
+        dst.unlink()
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
 
+def _dump_format(template: str, engine: str, work_dir: Path, env: dict, cfg: dict, name: str) -> Optional[Path]:
+    """Dump the template preamble into ``work_dir/<name>.fmt`` with mylatexformat."""
+    preamble = work_dir / f'{PREAMBLE_JOB}.tex'
+    preamble.write_text(template + '\n\\begin{document}\n\\end{document}\n', encoding='utf-8')
+    cmd = [engine, '-ini', '-interaction=nonstopmode', f'-jobname={name}',
+           f'&{engine}', 'mylatexformat.ltx', preamble.name]
+    try:
+        run_latex(cmd, work_dir, env, cfg)
+    except (OSError, subprocess.SubprocessError, CompileTimeout):
+        return None
+    fmt = work_dir / f'{name}.fmt'
+    return fmt if fmt.exists() else None
+
+
+def _format_key(template: str, cfg: dict, env: dict) -> Optional[tuple]:
+    """``(engine, engine_version, cache_key)`` for the template, or None when no format applies."""
+    engine = _engine(cfg)
+    if engine is None or not cfg['latex'].get('precompile', True):
+        return None
+    version = _engine_version(engine, env)
+    if not version:
+        return None
+    return engine, version, hash_key('fmt', FORMAT_VERSION, engine, version, template)
+
+
+def _prepare_format(template: str, work_dir: Path, cfg: dict, env: dict) -> Optional[str]:
+    """Return the name of a precompiled preamble format placed in ``work_dir``.
+
+    Formats live in the ``formats`` cache keyed by template text, engine and
+    engine version, so only the first compile of a template pays for the
+    dump. A preamble that cannot be dumped (e.g. fontspec fonts under XeLaTeX)
+    is remembered as such and later compiles go straight to the plain run.
+    """
+    cache = open_cache(cfg, 'formats', default_mb=512)
+    spec = _format_key(template, cfg, env) if cache is not None else None
+    if spec is None:
+        return None
+    engine, version, key = spec
+    name = f'koda-{key[:12]}'
+
+    with _FORMAT_LOCK:
+        entry = cache.get(key)
+        if entry is None:
+            fmt = _dump_format(template, engine, work_dir, env, cfg, name)
+            staging = cache.staging_dir()
+            if fmt is not None:
+                shutil.copy2(fmt, staging / fmt.name)
+            log = work_dir / f'{name}.log'
+            if log.exists():
+                shutil.copy2(log, staging / 'dump.log')
+            entry = cache.commit(key, staging, {'ok': fmt is not None, 'engine': engine, 'engine_version': version})
+        if not cache.meta(key).get('ok'):
+            return None
+        _place_file(entry / f'{name}.fmt', work_dir / f'{name}.fmt')
+    return name
+
+
+def _reject_format(template: str, cfg: dict, env: dict) -> None:
+    """Mark the template's format unusable so later compiles skip it."""
+    cache = open_cache(cfg, 'formats', default_mb=512)
+    spec = _format_key(template, cfg, env) if cache is not None else None
+    if spec is None:
+        return
+    engine, version, key = spec
+    with _FORMAT_LOCK:
+        staging = cache.staging_dir()
+        cache.commit(key, staging, {'ok': False, 'engine': engine, 'engine_version': version})
+
+
+def _compile_cmd(cfg: dict, tex_name: str, fmt: Optional[str]) -> list:
     compiler = cfg['latex']['compiler']
     compiler_path = cfg['latex'].get('compiler_path') or compiler
     if compiler == 'latexmk':
-        cmd = [compiler, '-pdf', '-xelatex', '-interaction=nonstopmode', '-output-directory=.', str(out_tex.name)]
-    elif compiler == 'pdflatex':
-        cmd = [compiler, '-interaction=nonstopmode', '-output-directory=.', str(out_tex.name)]
-    else:
-        # Fallback to original behavior for other compilers if not latexmk or pdflatex
-        cmd = [compiler_path, out_tex.name]
+        cmd = [compiler, '-pdf', '-xelatex', '-interaction=nonstopmode', '-output-directory=.']
+        if fmt:
+            cmd.append(f'-xelatex=xelatex -fmt={fmt} %O %S')
+        return cmd + [tex_name]
+    if compiler == 'pdflatex':
+        cmd = [compiler, '-interaction=nonstopmode', '-output-directory=.']
+        if fmt:
+            cmd.append(f'-fmt={fmt}')
+        return cmd + [tex_name]
+    # Fallback to original behavior for other compilers if not latexmk or pdflatex
+    return [compiler_path, tex_name]
 
-    env = os.environ.copy()
-    if 'bin_path' in cfg.get('latex', {}):
-        bin_path = str(Path(cfg['latex']['bin_path']).resolve())
-        env['PATH'] = f"{bin_path}{os.pathsep}{env['PATH']}"
 
+def _log_text(work_dir: Path) -> str:
     try:
-        subprocess.run(cmd, cwd=work_dir, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
-    except subprocess.CalledProcessError as exc:
-        raise RuntimeError(f"LaTeX compile error:\n{exc.stderr.decode('utf-8', errors='ignore')}") from exc
+        return (work_dir / 'main.log').read_text(encoding='utf-8', errors='ignore')
+    except OSError:
+        return ''
+
+
+def _assets_digest(tex: str, work_dir: Path) -> list:
+    """``(reference, sha256)`` for every file ``tex`` pulls in, resolved like LaTeX would from ``work_dir``."""
+    digest = []
+    for command, arg in ASSET_RE.findall(tex):
+        for ref in (r.strip() for r in arg.split(',')):
+            if not ref:
+                continue
+            found = None
+            for ext in ASSET_EXTS.get(command, ('',)):
+                path = work_dir / (ref + ext)
+                if path.is_file():
+                    found = path
+                    break
+            digest.append((command, ref, memo_file_sha256(found) if found else 'missing'))
+    return digest
+
+
+def _compile_key(tex: str, work_dir: Path, cfg: dict, env: dict, passes: int) -> str:
+    cmd = _compile_cmd(cfg, 'main.tex', None)
+    engine = _engine(cfg)
+    toolchain = [_engine_version(cmd[0], env), _engine_version(engine, env) if engine else '']
+    seeded = None
+    if passes == 1 and cfg['latex']['compiler'] != 'latexmk':
+        # A single pdflatex pass reads whatever .aux/.nav are already there
+        # (compile_frame seeds them from the deck), so they are inputs too.
+        seeded = _rerun_state(work_dir)
+    return hash_key('compile', COMPILE_CACHE_VERSION, tex, _assets_digest(tex, work_dir), cmd, toolchain, passes,
+                    seeded)
+
+
+def _rerun_state(work_dir: Path) -> dict:
+    state = {}
+    for ext in RERUN_EXTS:
+        path = work_dir / f'main.{ext}'
+        state[ext] = file_sha256(path) if path.exists() else None
+    return state
+
+
+def _collect_issues(work_dir: Path, template: str, body: str) -> list:
+    # main.tex is template + '\n' + body; figure rewrites never add lines.
+    first_line = template.count('\n') + 2
+    issues = assign_frames(parse_log(_log_text(work_dir)), body, first_line, _nav_pages(work_dir))
+    write_issues(work_dir, issues)
+    return issues
+
+
+def _run_passes(cmd: list, work_dir: Path, env: dict, cfg: dict, passes: int, deadline: float) -> int:
+    """Run ``cmd`` until the .aux/.toc/.nav files stop changing, at most ``passes`` times."""
+    for n in range(1, passes + 1):
+        before = _rerun_state(work_dir)
+        run_latex(cmd, work_dir, env, cfg, deadline)
+        if _rerun_state(work_dir) == before:
+            break
+    return n
 
+
+def compile_latex(talk_tex: Path, template_path: str, work_dir: Path, cfg: dict,
+                  owner: Optional[str] = None, max_passes: Optional[int] = None,
+                  asset_root: Optional[Path] = None, use_cache: bool = True) -> CompileResult:
+    """Compile ``template + talk_tex`` into ``work_dir/main.pdf``.
+
+    Returns a :class:`CompileResult` whose ``issues`` are the overfull and
+    underfull boxes and missing files found in ``main.log``, mapped to
+    frames and pages (also saved to ``compile_issues.json``). A failed
+    compile raises :class:`CompileError` carrying the same list.
+
+    Results are cached (the ``compile`` cache) by main.tex, the files it
+    references and the compiler command and version, so an unchanged deck
+    restores its PDF and log without running LaTeX; ``use_cache=False`` skips
+    the cache for throwaway compiles. With
+    ``latex.precompile`` (the default) the template preamble is loaded from a
+    cached precompiled format instead of being re-read on every run; if the
+    format itself breaks the run, the compile is retried without it.
+
+    Compiles wait for a slot in the shared pool (queued fairly by ``owner``,
+    the work directory by default) and run under ``latex.timeout``. pdflatex
+    is rerun while the .aux/.toc/.nav files still change, up to
+    ``1 + latex.retries`` passes (or ``max_passes``); latexmk does its own
+    reruns. Figures are resolved against ``asset_root`` (the work directory
+    by default) and its ``paper_src`` and swapped for slide-resolution
+    copies, see :mod:`core.figures`.
+    """
+    if not template_path:
+        raise ValueError('Template path is required')
+
+    template = Path(template_path).read_text(encoding='utf-8', errors='ignore')
+    body = talk_tex.read_text(encoding='utf-8', errors='ignore')
+
+    tex = prepare_figures(template + '\n' + body, work_dir, cfg, asset_root)
+    out_tex = work_dir / 'main.tex'
+    out_tex.write_text(tex, encoding='utf-8')
+
+    if max_passes is None:
+        max_passes = 1 + int(cfg['latex'].get('retries', 2))
+    if cfg['latex']['compiler'] == 'latexmk':
+        max_passes = 1
+
+    env = _latex_env(cfg)
     pdf_path = work_dir / 'main.pdf'
+    cache = open_cache(cfg, 'compile', default_mb=512) if use_cache else None
+    key = _compile_key(tex, work_dir, cfg, env, max_passes) if cache is not None else None
+    entry = cache.get(key) if key else None
+    if entry is not None:
+        for name in COMPILE_OUTPUTS:
+            if (entry / name).exists():
+                # Copied, not linked: LaTeX rewrites these files in place.
+                shutil.copy2(entry / name, work_dir / name)
+        _write_page_map(work_dir, _nav_pages(work_dir))
+        return CompileResult(pdf_path, _collect_issues(work_dir, template, body), cached=True)
+
+    with compile_slots(cfg).slot(owner or str(work_dir)):
+        deadline = time.monotonic() + float(latex_settings(cfg)['timeout'])
+        fmt = _prepare_format(template, work_dir, cfg, env)
+        try:
+            passes = _run_passes(_compile_cmd(cfg, out_tex.name, fmt), work_dir, env, cfg, max_passes, deadline)
+        except subprocess.CalledProcessError as exc:
+            stderr = exc.stderr.decode('utf-8', errors='ignore')
+            if not fmt or not FORMAT_ERROR_RE.search(stderr + _log_text(work_dir)):
+                raise CompileError(f"LaTeX compile error:\n{stderr}",
+                                   _collect_issues(work_dir, template, body)) from exc
+            _reject_format(template, cfg, env)
+            try:
+                passes = _run_passes(_compile_cmd(cfg, out_tex.name, None), work_dir, env, cfg, max_passes, deadline)
+            except subprocess.CalledProcessError as plain_exc:
+                raise CompileError(f"LaTeX compile error:\n{plain_exc.stderr.decode('utf-8', errors='ignore')}",
+                                   _collect_issues(work_dir, template, body)) from plain_exc
+
     if not pdf_path.exists():
         raise FileNotFoundError('PDF not generated')
 
-    return pdf_path
+    if cache is not None:
+        staging = cache.staging_dir()
+        for name in COMPILE_OUTPUTS:
+            if (work_dir / name).exists():
+                shutil.copy2(work_dir / name, staging / name)
+        cache.commit(key, staging, {'compiler': cfg['latex']['compiler']})
+
+    _write_page_map(work_dir, _nav_pages(work_dir))
+    return CompileResult(pdf_path, _collect_issues(work_dir, template, body), passes)
+
+
+def _pdf_stamp(pdf_path: Path) -> list:
+    stat = pdf_path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _nav_pages(work_dir: Path) -> Optional[list]:
+    """``[first, last]`` page ranges per frame, from the ``.nav`` file beamer writes."""
+    try:
+        nav = (work_dir / 'main.nav').read_text(encoding='utf-8', errors='ignore')
+    except OSError:
+        return None
+    return [[int(a), int(b)] for a, b in FRAMEPAGES_RE.findall(nav)] or None
+
+
+def _write_page_map(work_dir: Path, pages: Optional[list]) -> None:
+    map_path = work_dir / PAGE_MAP_NAME
+    pdf_path = work_dir / 'main.pdf'
+    if pages is None or not pdf_path.exists():
+        if map_path.exists():
+            map_path.unlink()
+        return
+    map_path.write_text(json.dumps({'pdf': _pdf_stamp(pdf_path), 'pages': pages}), encoding='utf-8')
+
+
+def frame_pages(work_dir: Path) -> Optional[list]:
+    """Page ranges per frame of ``work_dir/main.pdf``, or None when unknown or stale."""
+    pdf_path = work_dir / 'main.pdf'
+    try:
+        data = json.loads((work_dir / PAGE_MAP_NAME).read_text(encoding='utf-8'))
+        if data['pdf'] != _pdf_stamp(pdf_path):
+            return None
+    except (OSError, ValueError, KeyError):
+        return None
+    return data['pages']
+
+
+def _frame_counter(frames: FrameIndex, i: int) -> int:
+    """Value of beamer's ``framenumber`` counter just before frame ``i``."""
+    count = 0
+    for frame in frames.frames[:i]:
+        m = FRAME_OPTIONS_RE.match(frame.text)
+        if not (m and m.group(1) and 'noframenumbering' in m.group(1)):
+            count += 1
+    return count
+
+
+def compile_frame(frames: FrameIndex, i: int, old_frame: str, template_path: str, work_dir: Path,
+                  cfg: dict) -> Optional[CompileResult]:
+    """Recompile only frame ``i`` and splice its pages into ``work_dir/main.pdf``.
+
+    ``frames`` already holds the edited frame and ``old_frame`` is the text
+    it replaced. The frame is compiled on its own in ``work_dir/frame`` with
+    the deck's ``.aux``/``.nav`` (references, total frame count), the
+    preceding sectioning commands and the page/frame counters it had in the
+    deck, then its pages replace the old ones using the frame-to-page map of
+    the last compile. Returns None when a full compile is needed instead:
+    no valid page map, a change to labels, counters or numbering options,
+    a different page count (overlays), or a frame that does not compile on
+    its own.
+    """
+    if not cfg['latex'].get('frame_compile', True):
+        return None
+    pages = frame_pages(work_dir)
+    if pages is None or len(pages) != len(frames):
+        return None
+    if sorted(CROSS_FRAME_RE.findall(old_frame)) != sorted(CROSS_FRAME_RE.findall(frames[i])):
+        return None
+    first, last = pages[i]
+
+    frame_dir = work_dir / 'frame'
+    frame_dir.mkdir(parents=True, exist_ok=True)
+    for ext in ('aux', 'nav'):
+        src = work_dir / f'main.{ext}'
+        if src.exists():
+            shutil.copyfile(src, frame_dir / f'main.{ext}')
+    stale = frame_dir / 'main.pdf'
+    if stale.exists():
+        stale.unlink()
+
+    talk_tex = frame_dir / 'talk.tex'
+    talk_tex.write_text('\n'.join([
+        '\\begin{document}',
+        # Replayed sectioning must not emit the AtBeginSection frames again.
+        '\\AtBeginSection{}\\AtBeginSubsection{}',
+        frames.sectioning(i),
+        f'\\setcounter{{page}}{{{first}}}\\setcounter{{framenumber}}{{{_frame_counter(frames, i)}}}',
+        frames[i],
+        '\\end{document}',
+    ]), encoding='utf-8')
+    try:
+        # One pass: a rerun would replace the deck's .aux with the frame's own.
+        result = compile_latex(talk_tex, template_path, frame_dir, cfg, owner=str(work_dir), max_passes=1,
+                               asset_root=work_dir)
+    except (RuntimeError, FileNotFoundError):
+        return None
+    if page_count(result.pdf_path) != last - first + 1:
+        return None
+
+    pdf_path = work_dir / 'main.pdf'
+    replace_pdf_pages(pdf_path, first, last, result.pdf_path)
+    template = Path(template_path).read_text(encoding='utf-8', errors='ignore')
+    (work_dir / 'main.tex').write_text(prepare_figures(template + '\n' + frames.text(), work_dir, cfg),
+                                       encoding='utf-8')
+    _write_page_map(work_dir, pages)
+
+    # The frame job prints the deck's page numbers, so only frame indices change.
+    issues = [issue for issue in load_issues(work_dir) if issue.frame != i]
+    for issue in result.issues:
+        if issue.frame is not None:
+            issue.frame = i
+            issues.append(issue)
+    write_issues(work_dir, issues)
+    return CompileResult(pdf_path, issues, result.passes)
+
+
+class PreviewCompiler:
+    """Compile partial decks in a background thread while frames stream in.
+
+    Compiles run in ``work_dir/preview`` so they never touch the final
+    ``main.tex``. Only the newest submitted body is compiled: bodies that
+    arrive while a compile is running replace each other, so the preview is
+    at most one compile behind generation. Each successful compile is copied
+    to its own ``preview_NNN.pdf`` so a reader never sees a half-written file.
+    """
+
+    def __init__(self, template_path: str, work_dir: Path, cfg: dict):
+        self.template_path = template_path
+        self.cfg = cfg
+        self.work_dir = work_dir / 'preview'
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.pdf_path: Optional[Path] = None
+        self.frames = 0
+        self.version = 0
+        self.error: Optional[Exception] = None
+        self._pending = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._loop, name='preview-compiler', daemon=True)
+        self._thread.start()
+
+    def submit(self, body: str, frames: int) -> None:
+        """Queue ``body`` (a complete document body with ``frames`` frames)."""
+        with self._cond:
+            if not self._closed:
+                self._pending = (body, frames)
+                self._cond.notify()
+
+    def latest(self) -> tuple:
+        """Return ``(pdf_path, frames, version)`` of the newest finished compile."""
+        with self._cond:
+            return self.pdf_path, self.frames, self.version
+
+    def close(self, wait: bool = False) -> None:
+        """Drop any queued body; with ``wait`` also join the running compile."""
+        with self._cond:
+            self._closed = True
+            self._pending = None
+            self._cond.notify()
+        if wait:
+            self._thread.join()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                if self._pending is None:
+                    return
+                body, frames = self._pending
+                self._pending = None
+
+            talk_tex = self.work_dir / 'talk.tex'
+            talk_tex.write_text(body, encoding='utf-8')
+            try:
+                # Each streamed prefix is compiled once and then superseded:
+                # one pass is enough to look at, and caching it would only
+                # push useful entries out of the compile cache.
+                pdf_path = compile_latex(talk_tex, self.template_path, self.work_dir, self.cfg,
+                                         owner=str(self.work_dir.parent), max_passes=1,
+                                         asset_root=self.work_dir.parent, use_cache=False).pdf_path
+            except Exception as exc:
+                self.error = exc
+                continue
+
+            version = self.version + 1
+            snapshot = self.work_dir / f'preview_{version:03d}.pdf'
+            shutil.copyfile(pdf_path, snapshot)
+            with self._cond:
+                previous = self.pdf_path
+                self.pdf_path, self.frames, self.version = snapshot, frames, version
+            if previous is not None:
+                try:
+                    previous.unlink()
+                except OSError:
+                    # Still open in the viewer (Windows); it is small and
+                    # lives in the run's workspace.
+                    pass
@@ -1,30 +1,558 @@
-from pathlib import Path
+import glob
+import gzip
+import hashlib
+import os
+import re
+import shutil
+import time
+from pathlib import Path, PurePosixPath
+from typing import BinaryIO, Optional
 import tarfile
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
 import arxiv
+import requests
+from requests.adapters import HTTPAdapter
 
+from utils.disk_cache import DiskCache, file_sha256, hash_key, open_cache
 
-def fetch_arxiv_source(arxiv_id: str, dest_dir: Path) -> Path:
+
+VERSION_RE = re.compile(r'v\d+$')
+
+EPRINT_URL = 'https://arxiv.org/e-print/{}'
+ARCHIVE_NAME = 'source.archive'
+
+# Files LaTeX needs to build the paper; everything else is left in the archive.
+TEXT_SUFFIXES = {'.tex', '.ltx', '.sty', '.cls', '.clo', '.cfg', '.def', '.bib', '.bbl', '.bst'}
+GRAPHIC_SUFFIXES = {'.png', '.jpg', '.jpeg', '.pdf', '.eps', '.ps'}
+
+GRAPHICS_RE = re.compile(r'\\includegraphics\*?\s*(?:\[[^\]]*\])?\s*\{([^}]+)\}')
+# Files pulled in by name, whatever their extension: \input{plot.tikz},
+# \include{sec.txt}, \subimport{figs/}{fig.pgf}, pgfplots data tables, ...
+INPUT_RE = re.compile(
+    r'\\(?:input|include|subfile)\s*\{([^}]+)\}'
+    r'|\\input[ \t]+([^\s{}%\\]+)'
+    r'|\\(?:sub)?import\*?\s*\{([^}]*)\}\s*\{([^}]+)\}'
+    r'|\\addplot3?\+?\s*(?:\[[^\]]*\]\s*)?(?:table|file)\s*(?:\[[^\]]*\]\s*)?\{([^}]+)\}'
+    r'|\\(?:pgfplotstableread|lstinputlisting|verbatiminput)\s*(?:\[[^\]]*\]\s*)?\{([^}]+)\}'
+)
+# Extraction passes over the local archive copy; inputs can reference more inputs.
+MAX_EXTRACT_PASSES = 4
+
+DEFAULT_LIMITS = {
+    'max_file_mb': 50,
+    'max_total_mb': 200,
+    'max_archive_mb': 1024,
+}
+
+
+class _TeeReader:
+    """Read-through wrapper that copies every byte into ``sink`` and hashes it."""
+
+    def __init__(self, raw: BinaryIO, sink: BinaryIO, max_bytes: int):
+        self.raw = raw
+        self.sink = sink
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        if data:
+            self.bytes_read += len(data)
+            if self.bytes_read > self.max_bytes:
+                raise ValueError('Source archive exceeds fetch.max_archive_mb')
+            self.sink.write(data)
+            self.sha256.update(data)
+        return data
+
+    def drain(self) -> None:
+        while self.read(1 << 20):
+            pass
+
+
+class _Prefixed:
+    """File-like object that replays an already-consumed ``head`` before ``rest``."""
+
+    def __init__(self, head: bytes, rest):
+        self.head = head
+        self.rest = rest
+
+    def read(self, size: int = -1) -> bytes:
+        if not self.head:
+            return self.rest.read(size)
+        if size is None or size < 0:
+            data, self.head = self.head + self.rest.read(), b''
+            return data
+        data, self.head = self.head[:size], self.head[size:]
+        if len(data) < size:
+            data += self.rest.read(size - len(data))
+        return data
+
+
+def _limits(cfg: Optional[dict]) -> dict:
+    fetch_cfg = (cfg or {}).get('fetch') or {}
+    return {k: int(fetch_cfg.get(k, v)) * 1024 * 1024 for k, v in DEFAULT_LIMITS.items()}
+
+
+def _safe_relpath(name: str) -> Optional[PurePosixPath]:
+    rel = PurePosixPath(name.replace('\\', '/'))
+    if rel.is_absolute() or '..' in rel.parts or not rel.parts:
+        return None
+    return PurePosixPath(*[p for p in rel.parts if p != '.'])
+
+
+def _graphic_refs(text: str) -> set:
+    refs = set()
+    for match in GRAPHICS_RE.finditer(text):
+        path = PurePosixPath(match.group(1).strip().replace('\\', '/'))
+        if path.suffix.lower() in GRAPHIC_SUFFIXES:
+            path = path.with_suffix('')
+        refs.add(str(path))
+    return refs
+
+
+def _input_refs(text: str) -> set:
+    refs = set()
+    for match in INPUT_RE.finditer(text):
+        plain, bare, directory, imported, table, listing = match.groups()
+        ref = plain or bare or table or listing
+        if imported:
+            ref = f"{directory.strip().rstrip('/')}/{imported.strip()}" if directory.strip() else imported
+        refs.add(str(PurePosixPath(ref.strip().replace('\\', '/'))))
+    return refs
+
+
+def _is_input(rel: PurePosixPath, inputs: set) -> bool:
+    # Like _is_referenced, but the extension is part of the name.
+    return any('/'.join(rel.parts[i:]) in inputs for i in range(len(rel.parts)))
+
+
+def _is_referenced(rel: PurePosixPath, refs: set) -> bool:
+    # A figure is referenced when some trailing part of its path (without
+    # extension) equals an \includegraphics argument; this also covers
+    # files found through \graphicspath.
+    parts = rel.with_suffix('').parts
+    return any('/'.join(parts[i:]) in refs for i in range(len(parts)))
+
+
+class _Extractor:
+    def __init__(self, out_dir: Path, limits: dict):
+        self.out_dir = out_dir
+        self.limits = limits
+        self.total = 0
+        self.refs = set()
+        self.inputs = set()
+        self.written = []
+        self.skipped = []
+        self.deferred = set()
+
+    def _write(self, rel: PurePosixPath, fileobj) -> None:
+        # Sizes in archive headers can lie (and a gzipped single file has
+        # none), so the limits are enforced on the bytes actually written.
+        dest = self.out_dir.joinpath(*rel.parts)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
+        with open(dest, 'wb') as f:
+            for chunk in iter(lambda: fileobj.read(1 << 20), b''):
+                written += len(chunk)
+                if written > self.limits['max_file_mb']:
+                    break
+                if self.total + written > self.limits['max_total_mb']:
+                    raise ValueError('Extracted source exceeds fetch.max_total_mb')
+                f.write(chunk)
+        if written > self.limits['max_file_mb']:
+            dest.unlink()
+            self.skipped.append(rel.as_posix())
+            return
+        self.total += written
+        self.written.append(rel.as_posix())
+        if rel.suffix.lower() in TEXT_SUFFIXES or _is_input(rel, self.inputs):
+            text = dest.read_text(encoding='utf-8', errors='ignore')
+            self.refs |= _graphic_refs(text)
+            self.inputs |= _input_refs(text)
+
+    def _wanted(self, rel: PurePosixPath) -> bool:
+        if rel.suffix.lower() in GRAPHIC_SUFFIXES and _is_referenced(rel, self.refs):
+            return True
+        return _is_input(rel, self.inputs)
+
+    def offer(self, name: str, size: int, open_member, deferred_only: bool = False) -> None:
+        rel = _safe_relpath(name)
+        if rel is None:
+            self.skipped.append(name)
+            return
+        wanted_text = rel.suffix.lower() in TEXT_SUFFIXES or rel.name.startswith('00README')
+        if deferred_only:
+            wanted_text = False
+        if size > self.limits['max_file_mb']:
+            self.skipped.append(name)
+            return
+        if not wanted_text and not self._wanted(rel):
+            # Figures and other inputs may be referenced by a later member.
+            self.deferred.add(name)
+            return
+        self.deferred.discard(name)
+        self._write(rel, open_member())
+
+    def pending(self) -> set:
+        """Deferred members that the text extracted so far references."""
+        return {n for n in self.deferred if self._wanted(_safe_relpath(n))}
+
+    def report(self) -> dict:
+        return {
+            'files': len(self.written),
+            'bytes': self.total,
+            'skipped': len(self.skipped) + len(self.deferred),
+        }
+
+
+def _extract_tar(fileobj, extractor: _Extractor, only: Optional[set] = None) -> None:
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            if only is not None and member.name not in only:
+                continue
+            extractor.offer(member.name, member.size, lambda m=member: tar.extractfile(m),
+                            deferred_only=only is not None)
+
+
+def _extract_zip(archive: Path, extractor: _Extractor, only: Optional[set] = None) -> None:
+    with zipfile.ZipFile(archive, 'r') as zf:
+        for info in zf.infolist():
+            if info.is_dir() or (only is not None and info.filename not in only):
+                continue
+            extractor.offer(info.filename, info.file_size, lambda i=info: zf.open(i),
+                            deferred_only=only is not None)
+
+
+def _extract_stream(stream, archive: Path, out_dir: Path, limits: dict, mirror: bool = True) -> dict:
+    """Extract the LaTeX-relevant part of an arXiv e-print while it is read.
+
+    arXiv serves either a gzipped tarball, a gzipped single ``.tex`` file, a
+    zip, or a bare PDF when no source exists. The raw bytes are mirrored to
+    ``archive`` so figures and other inputs (``\\input{plot.tikz}``,
+    pgfplots tables, ...) referenced by a later member can be picked up in
+    cheap extra passes over the local copy. ``mirror=False``
+    is used when ``stream`` already is that local copy.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    extractor = _Extractor(out_dir, limits)
+
+    with open(archive if mirror else os.devnull, 'wb') as sink:
+        tee = _TeeReader(stream, sink, limits['max_archive_mb'])
+        head = tee.read(4)
+        if head.startswith(b'%PDF'):
+            raise ValueError('arXiv provides no LaTeX source for this paper')
+
+        if head.startswith(b'PK'):
+            tee.drain()
+            kind = 'zip'
+        elif head.startswith(b'\x1f\x8b'):
+            gz = gzip.GzipFile(fileobj=_Prefixed(head, tee), mode='rb')
+            inner = gz.read(512)
+            if inner[257:262] == b'ustar':
+                _extract_tar(_Prefixed(inner, gz), extractor)
+                kind = 'tar'
+            elif inner.startswith(b'%PDF'):
+                raise ValueError('arXiv provides no LaTeX source for this paper')
+            else:
+                extractor.offer('main.tex', 0, lambda: _Prefixed(inner, gz))
+                kind = 'tex'
+            tee.drain()
+        else:
+            _extract_tar(_Prefixed(head, tee), extractor)
+            tee.drain()
+            kind = 'tar'
+
+    if kind == 'zip':
+        _extract_zip(archive, extractor)
+
+    for _ in range(MAX_EXTRACT_PASSES):
+        pending = extractor.pending()
+        if not pending:
+            break
+        if kind == 'zip':
+            _extract_zip(archive, extractor, only=pending)
+        else:
+            with open(archive, 'rb') as f:
+                _extract_tar(f, extractor, only=pending)
+
+    report = extractor.report()
+    report['format'] = kind
+    report['archive_sha256'] = tee.sha256.hexdigest()
+    return report
+
+
+def _extract_archive(archive: Path, src_dir: Path, limits: dict) -> dict:
+    with open(archive, 'rb') as f:
+        return _extract_stream(f, archive, src_dir, limits, mirror=False)
+
+
+def _is_url(mirror: str) -> bool:
+    return mirror.startswith(('http://', 'https://'))
+
+
+def _mirror_file(mirror: Path, versioned_id: str) -> Path:
+    name = versioned_id.replace('/', '_')
+    for cand in [mirror / name, *sorted(mirror.glob(glob.escape(name) + '.*'))]:
+        if cand.is_file():
+            return cand
+    raise ValueError(f'{versioned_id} not found in mirror {mirror}')
+
+
+def _download_source(versioned_id: str, staging: Path, src_dir: Path, limits: dict,
+                     session: Optional[requests.Session] = None, timeout: float = 60,
+                     mirror: str = '') -> dict:
+    if mirror and not _is_url(mirror):
+        with open(_mirror_file(Path(mirror), versioned_id), 'rb') as f:
+            return _extract_stream(f, staging / ARCHIVE_NAME, src_dir, limits)
+
+    url = f"{mirror.rstrip('/')}/e-print/{versioned_id}" if mirror else EPRINT_URL.format(versioned_id)
+    http = session or requests
+    resp = http.get(url, stream=True, timeout=timeout)
+    try:
+        resp.raise_for_status()
+        length = int(resp.headers.get('Content-Length') or 0)
+        if length > limits['max_archive_mb']:
+            raise ValueError('Source archive exceeds fetch.max_archive_mb')
+        # Keep the bytes exactly as arXiv stores them; gzip is handled above.
+        resp.raw.decode_content = False
+        return _extract_stream(resp.raw, staging / ARCHIVE_NAME, src_dir, limits)
+    finally:
+        resp.close()
+
+
+def _tree_manifest(root: Path) -> dict:
+    # Content hashes, not sizes: an edit that keeps the size must not pass.
+    return {
+        p.relative_to(root).as_posix(): file_sha256(p)
+        for p in root.rglob('*') if p.is_file()
+    }
+
+
+def _tree_stamps(root: Path) -> dict:
+    """``[size, mtime_ns]`` per file: a cheap check that the tree is untouched since commit."""
+    stamps = {}
+    for p in root.rglob('*'):
+        if p.is_file():
+            stat = p.stat()
+            stamps[p.relative_to(root).as_posix()] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def _alias_key(arxiv_id: str) -> str:
+    return hash_key('alias', arxiv_id)
+
+
+def _source_key(versioned_id: str) -> str:
+    return hash_key('source', versioned_id)
+
+
+def _resolve_alias(cache: DiskCache, arxiv_id: str, ttl_hours: float) -> Optional[str]:
+    if VERSION_RE.search(arxiv_id):
+        return arxiv_id
+    if cache.get(_alias_key(arxiv_id)) is None:
+        return None
+    meta = cache.meta(_alias_key(arxiv_id))
+    if time.time() - meta.get('created', 0) > ttl_hours * 3600:
+        return None
+    return meta.get('target')
+
+
+def _cached_tree(cache: DiskCache, versioned_id: str, limits: dict) -> Optional[Path]:
+    key = _source_key(versioned_id)
+    entry = cache.get(key)
+    if entry is None:
+        return None
+
+    meta = cache.meta(key)
+    tree = entry / 'tree'
+    if tree.is_dir():
+        # Stamps survive the rename into the cache, so an unchanged tree is
+        # accepted without reading it; anything else is checked by content.
+        if meta.get('stamps') and _tree_stamps(tree) == meta['stamps']:
+            return tree
+        if _tree_manifest(tree) == meta.get('manifest'):
+            return tree
+
+    # The extracted tree was damaged; rebuild it if the archive is intact.
+    archive = entry / meta.get('archive', '')
+    if archive.is_file() and file_sha256(archive) == meta.get('archive_sha256'):
+        shutil.rmtree(tree, ignore_errors=True)
+        try:
+            _extract_archive(archive, tree, limits)
+        except (ValueError, OSError, tarfile.TarError, zipfile.BadZipFile):
+            pass
+        else:
+            if _tree_manifest(tree) == meta.get('manifest'):
+                return tree
+
+    cache.discard(key)
+    return None
+
+
+def _store_source(cache: DiskCache, versioned_id: str, limits: dict, **download_kwargs) -> Path:
+    staging = cache.staging_dir()
+    tree = staging / 'tree'
+    try:
+        report = _download_source(versioned_id, staging, tree, limits, **download_kwargs)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    entry = cache.commit(_source_key(versioned_id), staging, {
+        'arxiv_id': versioned_id,
+        'archive': ARCHIVE_NAME,
+        'archive_sha256': report.pop('archive_sha256'),
+        'extract': report,
+        'manifest': _tree_manifest(tree),
+        'stamps': _tree_stamps(tree),
+    })
+    return entry / 'tree'
+
+
+def _remember_alias(cache: DiskCache, arxiv_id: str, versioned_id: str) -> None:
+    if arxiv_id != versioned_id:
+        cache.commit(_alias_key(arxiv_id), cache.staging_dir(), {'target': versioned_id})
+
+
+def _materialize(arxiv_id: str, versioned_id: str, dest_dir: Path, limits: dict,
+                 cache: Optional[DiskCache], **download_kwargs) -> tuple:
+    src_dir = dest_dir / 'paper_src'
+    if cache is not None:
+        tree = _cached_tree(cache, versioned_id, limits)
+        cached = tree is not None
+        if not cached:
+            tree = _store_source(cache, versioned_id, limits, **download_kwargs)
+        _remember_alias(cache, arxiv_id, versioned_id)
+        # Copied, not linked: the run may edit its paper_src, the cache entry must not change.
+        shutil.copytree(tree, src_dir, dirs_exist_ok=True)
+        return src_dir, cached
+
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    _download_source(versioned_id, dest_dir, src_dir, limits, **download_kwargs)
+    return src_dir, False
+
+
+def _resolve_versions(ids: list, cache: Optional[DiskCache], cfg: Optional[dict], mirror: str) -> dict:
+    """Map each requested ID to a versioned ID, querying arXiv once for the rest.
+
+    IDs that already carry a version, that the cache knows an alias for, or
+    that are served from a mirror never reach the metadata API.
+    """
+    resolved = {}
+    pending = []
+    ttl_hours = ((cfg or {}).get('cache') or {}).get('alias_ttl_hours', 24)
+    for arxiv_id in ids:
+        if mirror or VERSION_RE.search(arxiv_id):
+            resolved[arxiv_id] = arxiv_id
+            continue
+        alias = _resolve_alias(cache, arxiv_id, ttl_hours) if cache is not None else None
+        if alias:
+            resolved[arxiv_id] = alias
+        else:
+            pending.append(arxiv_id)
+
+    if pending:
+        client = arxiv.Client(page_size=min(len(pending), 100))
+        search = arxiv.Search(id_list=pending, max_results=len(pending))
+        by_base = {}
+        for result in client.results(search):
+            short_id = result.get_short_id()
+            by_base[VERSION_RE.sub('', short_id)] = short_id
+        for arxiv_id in pending:
+            if arxiv_id in by_base:
+                resolved[arxiv_id] = by_base[arxiv_id]
+    return resolved
+
+
+def _fetch_cfg(cfg: Optional[dict]) -> dict:
+    return (cfg or {}).get('fetch') or {}
+
+
+def fetch_arxiv_source(arxiv_id: str, dest_dir: Path, cfg: Optional[dict] = None) -> Path:
     if not arxiv_id:
         raise ValueError('arXiv ID is required')
+    arxiv_id = arxiv_id.strip()
 
-    search = arxiv.Search(id_list=[arxiv_id])
-    result = next(search.results(), None)
-    if result is None:
+    fetch_cfg = _fetch_cfg(cfg)
+    mirror = fetch_cfg.get('mirror') or ''
+    cache = open_cache(cfg, 'sources', default_mb=2048)
+    versioned_id = _resolve_versions([arxiv_id], cache, cfg, mirror).get(arxiv_id)
+    if versioned_id is None:
         raise ValueError('arXiv ID not found')
 
-    src_path = Path(result.download_source(dirpath=dest_dir))
-    src_dir = dest_dir / 'paper_src'
-    src_dir.mkdir(parents=True, exist_ok=True)
+    src_dir, _ = _materialize(arxiv_id, versioned_id, dest_dir, _limits(cfg), cache,
+                              timeout=fetch_cfg.get('timeout', 60), mirror=mirror)
+    return src_dir
 
-    if src_path.suffixes[-2:] == ['.tar', '.gz']:
-        with tarfile.open(src_path, 'r:gz') as tar:
-            tar.extractall(path=src_dir)
-    elif src_path.suffix == '.zip':
-        with zipfile.ZipFile(src_path, 'r') as zf:
-            zf.extractall(path=src_dir)
-    else:
-        raise ValueError('Unsupported source archive')
 
-    return src_dir
+@dataclass
+class FetchResult:
+    arxiv_id: str
+    src_dir: Optional[Path] = None
+    version: Optional[str] = None
+    cached: bool = False
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def fetch_arxiv_sources(ids: list, dest_root: Path, cfg: Optional[dict] = None,
+                        max_workers: Optional[int] = None, mirror: Optional[str] = None) -> dict:
+    """Fetch several papers at once into ``dest_root/<id>/paper_src``.
+
+    Metadata for all unresolved IDs is looked up in one batched ``id_list``
+    query, then archives are downloaded concurrently over one pooled HTTP
+    session. ``mirror`` (or ``fetch.mirror``) may be a local directory of
+    e-print files or the base URL of a server exposing ``/e-print/<id>``,
+    which keeps the whole call offline. Failures are reported per ID in the
+    returned ``{id: FetchResult}`` mapping instead of being raised.
+    """
+    fetch_cfg = _fetch_cfg(cfg)
+    if mirror is None:
+        mirror = fetch_cfg.get('mirror') or ''
+    max_workers = max_workers or fetch_cfg.get('max_workers', 4)
+    ids = list(dict.fromkeys(i.strip() for i in ids if i and i.strip()))
+    results = {i: FetchResult(i) for i in ids}
+    if not ids:
+        return results
+
+    cache = open_cache(cfg, 'sources', default_mb=2048)
+    try:
+        versions = _resolve_versions(ids, cache, cfg, mirror)
+    except Exception as exc:
+        for res in results.values():
+            res.error = f'metadata lookup failed: {exc}'
+        return results
+
+    limits = _limits(cfg)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    def work(arxiv_id: str) -> None:
+        res = results[arxiv_id]
+        res.version = versions[arxiv_id]
+        dest_dir = dest_root / arxiv_id.replace('/', '_')
+        try:
+            res.src_dir, res.cached = _materialize(
+                arxiv_id, res.version, dest_dir, limits, cache,
+                session=session, timeout=fetch_cfg.get('timeout', 60), mirror=mirror)
+        except Exception as exc:
+            res.error = str(exc) or exc.__class__.__name__
+
+    with session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for arxiv_id in ids:
+            if arxiv_id not in versions:
+                results[arxiv_id].error = 'arXiv ID not found'
+            else:
+                pool.submit(work, arxiv_id)
+    return results
@@ -0,0 +1,196 @@
+"""Pre-compile figure stage.
+
+Finds every ``\\includegraphics`` in main.tex, resolves it against the run
+workspace and the extracted paper source, and replaces heavy files with
+slide-resolution copies: rasters are downsampled to ``figures.max_px`` on
+the long side and large vector PDFs (dense plots, point clouds) are
+rasterized at ``figures.dpi``. Optimized copies are cached by content hash
+(the ``figures`` cache) and the compile is pointed at them by rewriting the
+paths in main.tex, so the paper's own files are never modified. A ``page=N``
+option on a PDF rasterizes that page and is dropped from the rewritten
+include.
+"""
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import fitz  # PyMuPDF
+
+from utils.disk_cache import hash_key, memo_file_sha256, open_cache
+
+
+FIGURES_VERSION = 1
+FIGURES_DIR = '_figures'
+DEFAULT_FIGURES = {
+    'enabled': True,
+    'max_px': 1600,          # long side of raster figures on a slide
+    'dpi': 200,              # rasterization density for heavy vector PDFs
+    'min_kb': 256,           # smaller rasters within max_px are used as-is
+    'pdf_raster_kb': 1024,   # vector PDFs above this size are rasterized
+    'jpeg_quality': 85,
+}
+RASTER_EXTS = ('.png', '.jpg', '.jpeg')
+GRAPHICS_EXTS = ('', '.pdf', '.png', '.jpg', '.jpeg')
+INCLUDE_RE = re.compile(r'(\\includegraphics\*?\s*(?:\[[^\]]*\])?\s*\{)([^}]*)(\})')
+GRAPHICSPATH_RE = re.compile(r'\\graphicspath\s*\{((?:\s*\{[^}]*\})*)\s*\}')
+OPTIONS_RE = re.compile(r'\[([^\]]*)\]')
+PAGE_RE = re.compile(r'^\s*page\s*=\s*\{?\s*(\d+)\s*\}?\s*$')
+
+
+def settings(cfg: dict) -> dict:
+    return {**DEFAULT_FIGURES, **(cfg.get('figures') or {})}
+
+
+def _search_dirs(tex: str, root: Path) -> list:
+    dirs = [root, root / 'paper_src']
+    for m in GRAPHICSPATH_RE.finditer(tex):
+        for sub in re.findall(r'\{([^}]*)\}', m.group(1)):
+            dirs += [root / sub, root / 'paper_src' / sub]
+    return dirs
+
+
+def _resolve(ref: str, dirs: list) -> Optional[Path]:
+    for base in dirs:
+        for ext in GRAPHICS_EXTS:
+            path = base / (ref + ext)
+            if path.is_file() and path.suffix.lower() in ('.pdf',) + RASTER_EXTS:
+                return path
+    return None
+
+
+def _needs_work(path: Path, opts: dict) -> bool:
+    size_kb = path.stat().st_size / 1024
+    if path.suffix.lower() == '.pdf':
+        return size_kb > float(opts['pdf_raster_kb'])
+    if size_kb > float(opts['min_kb']):
+        return True
+    pix = fitz.Pixmap(str(path))
+    return max(pix.width, pix.height) > int(opts['max_px'])
+
+
+def _page_option(head: str) -> tuple:
+    """Split ``page=N`` out of the ``\\includegraphics[...]`` options in ``head``.
+
+    Returns ``(page, head)`` with a 0-based page and ``head`` without the
+    option, for use once the page has been rasterized on its own.
+    """
+    m = OPTIONS_RE.search(head)
+    if m is None:
+        return 0, head
+    items = m.group(1).split(',')
+    pages = [PAGE_RE.match(item) for item in items]
+    found = next((p for p in pages if p), None)
+    if found is None:
+        return 0, head
+    rest = ','.join(item for item, p in zip(items, pages) if not p)
+    options = f'[{rest}]' if rest.strip() else ''
+    return max(0, int(found.group(1)) - 1), head[:m.start()] + options + head[m.end():]
+
+
+def _optimize(src: Path, dest_dir: Path, opts: dict, page_no: int = 0) -> Path:
+    """Write a slide-resolution copy of page ``page_no`` of ``src`` into ``dest_dir``."""
+    doc = fitz.open(src)
+    try:
+        page = doc[page_no]
+        rect = page.rect
+        is_pdf = src.suffix.lower() == '.pdf'
+        if is_pdf:
+            pixels_per_unit = float(opts['dpi']) / 72.0
+        else:
+            # Images open with a page size derived from their DPI metadata,
+            # so scale relative to the real pixel width.
+            pixels_per_unit = fitz.Pixmap(str(src)).width / max(rect.width, 1)
+        long_side = max(rect.width, rect.height, 1) * pixels_per_unit
+        scale = pixels_per_unit * min(1.0, int(opts['max_px']) / long_side)
+        is_jpeg = src.suffix.lower() in ('.jpg', '.jpeg')
+        pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), alpha=not is_jpeg and not is_pdf)
+        if is_jpeg:
+            out = dest_dir / 'figure.jpg'
+            pix.save(out, jpg_quality=int(opts['jpeg_quality']))
+        else:
+            out = dest_dir / 'figure.png'
+            pix.save(out)
+    finally:
+        doc.close()
+    return out
+
+
+def _cached_copy(src: Path, opts: dict, cfg: dict, out_dir: Path, page_no: int = 0) -> Path:
+    key = hash_key('figure', FIGURES_VERSION, memo_file_sha256(src), page_no,
+                   *(opts[k] for k in ('max_px', 'dpi', 'jpeg_quality')))
+    cache = open_cache(cfg, 'figures', default_mb=512)
+    entry = cache.get(key) if cache is not None else None
+    if entry is None:
+        if cache is not None:
+            staging = cache.staging_dir()
+            optimized = _optimize(src, staging, opts, page_no)
+            entry = cache.commit(key, staging, {'source': src.name, 'source_bytes': src.stat().st_size,
+                                                'bytes': optimized.stat().st_size})
+        else:
+            entry = out_dir / f'.{key[:16]}'
+            if not entry.exists():
+                entry.mkdir(parents=True)
+                _optimize(src, entry, opts, page_no)
+    produced = next(p for p in entry.iterdir() if p.name.startswith('figure.'))
+
+    dest = out_dir / f'{key[:16]}{produced.suffix}'
+    if not dest.exists():
+        out_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            # Cache entries are never written in place, so a hard link is safe.
+            os.link(produced, dest)
+        except OSError:
+            shutil.copy2(produced, dest)
+    return dest
+
+
+def prepare_figures(tex: str, work_dir: Path, cfg: dict, asset_root: Optional[Path] = None) -> str:
+    """Return ``tex`` with ``\\includegraphics`` pointing at resolved, optimized files.
+
+    ``work_dir`` is where LaTeX runs; ``asset_root`` (default ``work_dir``)
+    is the run workspace that figure paths and ``paper_src`` are relative
+    to. Figures that cannot be found are left alone for LaTeX to report.
+    """
+    opts = settings(cfg)
+    if not opts['enabled']:
+        return tex
+    root = asset_root or work_dir
+    dirs = _search_dirs(tex, root)
+    out_dir = work_dir / FIGURES_DIR
+    resolved: dict = {}
+
+    def rewrite(m: re.Match) -> str:
+        ref = m.group(2).strip()
+        page_no, plain_head = _page_option(m.group(1))
+        if (ref, page_no) not in resolved:
+            src = _resolve(ref, dirs)
+            path = None
+            optimized = False
+            if src is not None:
+                target = src
+                if src.suffix.lower() == '.pdf' or not page_no:
+                    try:
+                        if _needs_work(src, opts):
+                            target = _cached_copy(src, opts, cfg, out_dir, page_no)
+                            optimized = True
+                    except Exception:
+                        # Unreadable, truncated or encrypted file (MuPDF raises
+                        # its own error types), or no such page: let LaTeX
+                        # embed (and report on) the original.
+                        pass
+                try:
+                    path = Path(os.path.relpath(target, work_dir)).as_posix()
+                except ValueError:
+                    # Different drive on Windows.
+                    path = target.resolve().as_posix()
+            resolved[ref, page_no] = path, optimized
+        path, optimized = resolved[ref, page_no]
+        if path is None or ' ' in path:
+            return m.group(0)
+        # A rasterized copy holds only the requested page.
+        head = plain_head if optimized else m.group(1)
+        return f'{head}{path}{m.group(3)}'
+
+    return INCLUDE_RE.sub(rewrite, tex)
@@ -0,0 +1,252 @@
+import hashlib
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+
+FRAME_ENVS = {'frame', 'frame*'}
+VERBATIM_ENVS = {'verbatim', 'verbatim*', 'Verbatim', 'Verbatim*', 'lstlisting', 'minted', 'comment', 'semiverbatim'}
+
+TOKEN_RE = re.compile(
+    r'(?P<comment>(?<!\\)%)'
+    r'|\\begin\s*\{(?P<begin>[^}]*)\}'
+    r'|\\end\s*\{(?P<end>[^}]*)\}'
+    r'|\\verb\*?(?P<verb>[^A-Za-z\s*])'
+    r'|(?P<frame>\\frame)(?![A-Za-z@])'
+)
+OVERLAY_RE = re.compile(r'\s*<[^>]*>')
+OPTION_RE = re.compile(r'\s*\[[^\]]*\]')
+FRAMETITLE_RE = re.compile(r'\\frametitle\s*(?:<[^>]*>)?\s*(?:\[[^\]]*\])?\s*(?=\{)')
+SECTIONING_RE = re.compile(r'\\appendix(?![A-Za-z@])|\\(?:sub){0,2}section\*?(?![A-Za-z@])')
+COMMENT_RE = re.compile(r'(?<!\\)%.*')
+
+
+def _skip_line(text: str, pos: int) -> int:
+    end = text.find('\n', pos)
+    return len(text) if end < 0 else end
+
+
+def _match_brace(text: str, open_pos: int) -> int:
+    """Return the index just past the ``}`` matching ``text[open_pos] == '{'``."""
+    depth = 0
+    i = open_pos
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == '\\':
+            i += 2
+            continue
+        if ch == '%':
+            i = _skip_line(text, i)
+            continue
+        if ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return -1
+
+
+def _skip_options(text: str, pos: int) -> int:
+    while True:
+        match = OVERLAY_RE.match(text, pos) or OPTION_RE.match(text, pos)
+        if match is None:
+            return pos
+        pos = match.end()
+
+
+def _frame_title(frame: str) -> str:
+    match = FRAMETITLE_RE.search(frame)
+    if match:
+        end = _match_brace(frame, match.end())
+        return frame[match.end() + 1:end - 1].strip() if end > 0 else ''
+
+    head = re.match(r'\\begin\s*\{frame\*?\}|\\frame\s*', frame)
+    if head is None:
+        return ''
+    pos = _skip_options(frame, head.end())
+    while pos < len(frame) and frame[pos] in ' \t\n':
+        pos += 1
+    if frame.startswith('{', pos) and not frame.startswith('\\frame', 0):
+        end = _match_brace(frame, pos)
+        return frame[pos + 1:end - 1].strip() if end > 0 else ''
+    return ''
+
+
+def scan_frames(text: str) -> list:
+    """Return ``(start, end)`` offsets of every top-level frame in ``text``.
+
+    Understands ``\\begin{frame}``/``frame*`` environments and the
+    ``\\frame{...}`` command form, and ignores anything inside comments,
+    ``\\verb`` and verbatim-like environments, so a commented or quoted
+    ``\\end{frame}`` does not end a frame early.
+    """
+    spans = []
+    depth = 0
+    start = None
+    pos = 0
+    while True:
+        m = TOKEN_RE.search(text, pos)
+        if m is None:
+            break
+        pos = m.end()
+        if m.group('comment'):
+            pos = _skip_line(text, m.end())
+        elif m.group('verb'):
+            close = text.find(m.group('verb'), m.end())
+            pos = len(text) if close < 0 else close + 1
+        elif m.group('begin') is not None:
+            env = m.group('begin').strip()
+            if env in VERBATIM_ENVS:
+                close = text.find('\\end{' + env + '}', m.end())
+                pos = len(text) if close < 0 else close + len(env) + 6
+            elif env in FRAME_ENVS:
+                if depth == 0:
+                    start = m.start()
+                depth += 1
+        elif m.group('end') is not None:
+            if m.group('end').strip() in FRAME_ENVS and depth > 0:
+                depth -= 1
+                if depth == 0:
+                    spans.append((start, m.end()))
+        elif m.group('frame') and depth == 0:
+            brace = _skip_options(text, m.end())
+            while brace < len(text) and text[brace] in ' \t\n':
+                brace += 1
+            if brace < len(text) and text[brace] == '{':
+                end = _match_brace(text, brace)
+                if end > 0:
+                    spans.append((m.start(), end))
+                    pos = end
+    return spans
+
+
+@dataclass
+class Frame:
+    text: str
+    title: str
+    digest: str
+
+    @classmethod
+    def from_text(cls, text: str) -> 'Frame':
+        return cls(text=text, title=_frame_title(text), digest=hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+
+class FrameIndex:
+    """Parsed view of a Beamer body as alternating gaps and frames.
+
+    The body is held as ``gaps[0] frame[0] gaps[1] frame[1] ... gaps[n]`` so
+    replacing, inserting or splitting a frame only touches its own slot
+    instead of searching the body text. Offsets in the current text are
+    derived lazily and cached until the next edit.
+    """
+
+    def __init__(self, body: str):
+        spans = scan_frames(body)
+        self.gaps = []
+        self.frames = []
+        prev = 0
+        for start, end in spans:
+            self.gaps.append(body[prev:start])
+            self.frames.append(Frame.from_text(body[start:end]))
+            prev = end
+        self.gaps.append(body[prev:])
+        self._text = body
+        self._offsets = [span for span in spans]
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def __getitem__(self, i: int) -> str:
+        return self.frames[i].text
+
+    def __iter__(self):
+        return (f.text for f in self.frames)
+
+    def _touch(self) -> None:
+        self._text = None
+        self._offsets = None
+
+    def text(self) -> str:
+        if self._text is None:
+            parts = [self.gaps[0]]
+            for frame, gap in zip(self.frames, self.gaps[1:]):
+                parts.append(frame.text)
+                parts.append(gap)
+            self._text = ''.join(parts)
+        return self._text
+
+    def span(self, i: int) -> tuple:
+        """``(start, end)`` offsets of frame ``i`` in :meth:`text`."""
+        if self._offsets is None:
+            offsets = []
+            pos = 0
+            for frame, gap in zip(self.frames, self.gaps):
+                pos += len(gap)
+                offsets.append((pos, pos + len(frame.text)))
+                pos += len(frame.text)
+            self._offsets = offsets
+        return self._offsets[i]
+
+    def title(self, i: int) -> str:
+        return self.frames[i].title
+
+    def sectioning(self, i: int) -> str:
+        """``\\section``/``\\subsection``/``\\appendix`` commands in the gaps before frame ``i``."""
+        commands = []
+        for gap in self.gaps[:i + 1]:
+            gap = COMMENT_RE.sub('', gap)
+            pos = 0
+            while True:
+                m = SECTIONING_RE.search(gap, pos)
+                if m is None:
+                    break
+                pos = _skip_options(gap, m.end())
+                while pos < len(gap) and gap[pos] in ' \t\n':
+                    pos += 1
+                if not m.group().startswith('\\appendix') and gap.startswith('{', pos):
+                    end = _match_brace(gap, pos)
+                    pos = end if end > 0 else len(gap)
+                commands.append(gap[m.start():pos].strip())
+        return '\n'.join(commands)
+
+    def find(self, digest: str) -> Optional[int]:
+        return next((i for i, f in enumerate(self.frames) if f.digest == digest), None)
+
+    @staticmethod
+    def _parse_fragment(text: str) -> tuple:
+        fragment = FrameIndex(text)
+        if not fragment.frames:
+            raise ValueError('No frame found in replacement text')
+        return fragment.frames, fragment.gaps[1:-1]
+
+    def replace(self, i: int, text: str) -> int:
+        """Replace frame ``i`` with the frame(s) in ``text``; returns how many."""
+        frames, inner_gaps = self._parse_fragment(text)
+        self.frames[i:i + 1] = frames
+        self.gaps[i + 1:i + 1] = inner_gaps
+        self._touch()
+        return len(frames)
+
+    def split(self, i: int, parts: list) -> int:
+        return self.replace(i, '\n\n'.join(parts))
+
+    def insert(self, i: int, text: str, gap: str = '\n\n') -> int:
+        """Insert the frame(s) in ``text`` before frame ``i``."""
+        frames, inner_gaps = self._parse_fragment(text)
+        if i >= len(self.frames):
+            self.frames.extend(frames)
+            self.gaps[-1:-1] = [gap, *inner_gaps]
+        else:
+            self.frames[i:i] = frames
+            self.gaps[i + 1:i + 1] = [*inner_gaps, gap]
+        self._touch()
+        return len(frames)
+
+    def delete(self, i: int) -> None:
+        del self.frames[i]
+        # Keep the gap before the frame, drop the one after it.
+        del self.gaps[i + 1]
+        self._touch()
@@ -1,134 +1,844 @@
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional
 
+from core import mock_llm, telemetry
+from core.frames import FrameIndex, scan_frames
+from core.providers import get_async_client, get_client
+from core.resilience import LATENCY, acall_with_retry, call_with_retry, hedge_settings, hedged_call
+from utils.disk_cache import hash_key, open_cache
+from utils.rate_limit import RateLimiter
+from utils.run_meta import bump_run_counters
 
-def _build_prompt(agents_text: str, paper_tex: str) -> str:
-    return '\n'.join([
-        agents_text.strip(),
-        '',
+
+SECTION_RE = re.compile(r'\\section\*?\s*(?:\[[^\]]*\])?\s*\{')
+SECTIONS_MARKER = '%%KODA-SECTIONS%%'
+
+# One fix.rpm limiter per (provider, model, rpm), shared by every batch,
+# autofix round and Streamlit session in the process.
+_FIX_LIMITERS: dict = {}
+_FIX_LIMITERS_LOCK = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Prompt:
+    """A stable ``system`` prefix and the per-call ``user`` suffix.
+
+    The prefix holds the AGENTS.md rules (plus, in sections mode, the shared
+    paper context) and is byte-identical across calls, so providers can
+    serve it from their prompt cache. ``rules`` is the AGENTS.md text alone
+    when the prefix carries more than that; telemetry versions prompts by it.
+    """
+    system: str
+    user: str
+    rules: str = ''
+
+    def __str__(self) -> str:
+        return self.system + '\n\n' + self.user
+
+
+# AGENTS.md text by path, re-read only when its mtime or size changes.
+_AGENTS_CACHE: dict = {}
+
+
+def _load_agents(agents_path: Path) -> str:
+    stat = agents_path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _AGENTS_CACHE.get(str(agents_path))
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    text = agents_path.read_text(encoding='utf-8', errors='ignore').strip()
+    _AGENTS_CACHE[str(agents_path)] = (stamp, text)
+    return text
+
+
+def _build_prompt(agents_text: str, paper_tex: str) -> Prompt:
+    return Prompt(agents_text, '\n'.join([
         '## Paper LaTeX Source',
         paper_tex.strip(),
-    ])
+    ]))
 
 
-def _build_fix_prompt(agents_text: str, frame_tex: str) -> str:
-    return '\n'.join([
-        agents_text.strip(),
-        '',
+def _build_fix_prompt(agents_text: str, frame_tex: str, notes: Optional[list] = None) -> Prompt:
+    lines = [
         '## Task',
         'Only modify the following single frame. Do not output any extra text.',
         'Keep the output limited to one or two frames if splitting is needed.',
         '',
-        '## Frame',
-        frame_tex.strip(),
+    ]
+    if notes:
+        lines += ['## LaTeX Problems', *(f'- {note}' for note in notes), '']
+    return Prompt(agents_text, '\n'.join([*lines, '## Frame', frame_tex.strip()]))
+
+
+def _build_sections_system(agents_text: str, context: str) -> str:
+    # Shared by the outline and every section call of one paper.
+    return '\n'.join([
+        agents_text,
+        '',
+        '## Paper Context',
+        context.strip(),
     ])
 
 
-def _call_openai(prompt: str, cfg: dict) -> str:
-    try:
-        from openai import OpenAI
-    except Exception as exc:
-        raise RuntimeError('openai package is required') from exc
+def _build_section_prompt(system: str, title: str, section_tex: str, index: int, total: int,
+                          rules: str = '') -> Prompt:
+    return Prompt(system, rules=rules, user='\n'.join([
+        '## Task',
+        f'Generate only the frames for section {index} of {total} of the paper: "{title}".',
+        'Do not output a title page, an outline, a conclusion, \\begin{document} or \\end{document}.',
+        'Other sections are handled separately; do not repeat their content.',
+        '',
+        '## Section LaTeX Source',
+        section_tex.strip(),
+    ]))
+
+
+def _build_outline_prompt(system: str, titles: list, rules: str = '') -> Prompt:
+    return Prompt(system, rules=rules, user='\n'.join([
+        '## Task',
+        'The body frames are generated separately, one batch per section, in this order:',
+        *[f'{i}. {t}' for i, t in enumerate(titles, 1)],
+        '',
+        'Output only the opening frames (title page, outline) and the closing frames',
+        '(conclusion, limitations, future work), separated by a line containing exactly',
+        SECTIONS_MARKER,
+        'Do not output \\begin{document} or \\end{document}.',
+    ]))
+
+
+def _split_sections(paper_tex: str, min_chars: int) -> tuple:
+    """Split a flattened paper into ``(context, [(title, text), ...])``.
+
+    ``context`` is everything before the first ``\\section`` (title, authors,
+    abstract) and is shared by every section prompt. Sections shorter than
+    ``min_chars`` are merged into the previous one to avoid tiny calls.
+    """
+    starts = [m for m in SECTION_RE.finditer(paper_tex)]
+    if not starts:
+        return '', [('Paper', paper_tex)]
+
+    context = paper_tex[:starts[0].start()]
+    sections = []
+    bounds = [m.start() for m in starts] + [len(paper_tex)]
+    for match, start, end in zip(starts, bounds, bounds[1:]):
+        depth, pos = 1, match.end()
+        while pos < len(paper_tex) and depth:
+            depth += {'{': 1, '}': -1}.get(paper_tex[pos], 0)
+            pos += 1
+        title = paper_tex[match.end():pos - 1].strip()
+        text = paper_tex[start:end]
+        if sections and len(text) < min_chars:
+            prev_title, prev_text = sections[-1]
+            sections[-1] = (prev_title, prev_text + text)
+        else:
+            sections.append((title, text))
+    return context, sections
+
+
+def _frames_only(output: str) -> str:
+    output = output.replace('\\begin{document}', '').replace('\\end{document}', '')
+    frames = FrameIndex(output)
+    return '\n\n'.join(frames) if len(frames) else output.strip()
+
+
+def _wrap_document(output: str) -> str:
+    if '\\begin{document}' not in output:
+        output = '\n'.join([
+            '\\begin{document}',
+            output.strip(),
+            '\\end{document}',
+        ])
+    return output
+
+
+def _openai_messages(prompt: Prompt) -> list:
+    # OpenAI and DeepSeek cache identical prompt prefixes automatically; the
+    # system message keeps the stable part first.
+    return [
+        {'role': 'system', 'content': prompt.system},
+        {'role': 'user', 'content': prompt.user},
+    ]
+
+
+def _anthropic_system(prompt: Prompt) -> list:
+    return [{'type': 'text', 'text': prompt.system, 'cache_control': {'type': 'ephemeral'}}]
+
+
+def _openai_usage(usage) -> dict:
+    if usage is None:
+        return {}
+    cached = getattr(getattr(usage, 'prompt_tokens_details', None), 'cached_tokens', None)
+    if cached is None:
+        # DeepSeek reports its disk cache hits separately.
+        cached = getattr(usage, 'prompt_cache_hit_tokens', 0)
+    return {
+        'input_tokens': usage.prompt_tokens or 0,
+        'cached_tokens': cached or 0,
+        'cache_write_tokens': 0,
+        'output_tokens': usage.completion_tokens or 0,
+    }
+
+
+def _anthropic_usage(usage) -> dict:
+    if usage is None:
+        return {}
+    read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+    write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    return {
+        'input_tokens': (usage.input_tokens or 0) + read + write,
+        'cached_tokens': read,
+        'cache_write_tokens': write,
+        'output_tokens': usage.output_tokens or 0,
+    }
 
-    client_kwargs = {}
-    base_url = cfg['llm'].get('base_url', '')
-    if base_url:
-        client_kwargs['base_url'] = base_url
 
-    client = OpenAI(api_key=cfg['llm']['api_key'], **client_kwargs)
+def _timeout_kwargs(timeout: Optional[float]) -> dict:
+    # The SDKs read timeout=None as "no timeout", so only pass a real value.
+    return {} if timeout is None else {'timeout': timeout}
+
+
+def _call_openai(prompt: Prompt, cfg: dict, timeout: Optional[float] = None) -> tuple:
+    client = get_client(cfg, 'openai')
     resp = client.chat.completions.create(
         model=cfg['llm']['model'],
-        messages=[{'role': 'user', 'content': prompt}],
+        messages=_openai_messages(prompt),
         temperature=cfg['llm'].get('temperature', 0.2),
         max_tokens=cfg['llm'].get('max_tokens', 4000),
+        **_timeout_kwargs(timeout),
     )
-    return resp.choices[0].message.content
+    return resp.choices[0].message.content, _openai_usage(resp.usage)
 
 
-def _call_anthropic(prompt: str, cfg: dict) -> str:
-    try:
-        import anthropic
-    except Exception as exc:
-        raise RuntimeError('anthropic package is required') from exc
-
-    client = anthropic.Anthropic(api_key=cfg['llm']['api_key'])
+def _call_anthropic(prompt: Prompt, cfg: dict, timeout: Optional[float] = None) -> tuple:
+    client = get_client(cfg, 'anthropic')
     resp = client.messages.create(
         model=cfg['llm']['model'],
         max_tokens=cfg['llm'].get('max_tokens', 4000),
         temperature=cfg['llm'].get('temperature', 0.2),
-        messages=[{'role': 'user', 'content': prompt}],
+        system=_anthropic_system(prompt),
+        messages=[{'role': 'user', 'content': prompt.user}],
+        **_timeout_kwargs(timeout),
     )
-    return resp.content[0].text
+    return resp.content[0].text, _anthropic_usage(resp.usage)
+
+
+def _stream_openai(prompt: Prompt, cfg: dict, provider: str = 'openai',
+                   timeout: Optional[float] = None, usage: Optional[dict] = None) -> Iterator[str]:
+    client = get_client(cfg, provider)
+    default_model = 'deepseek-chat' if provider == 'deepseek' else None
+    stream = client.chat.completions.create(
+        model=cfg['llm'].get('model', default_model),
+        messages=_openai_messages(prompt),
+        temperature=cfg['llm'].get('temperature', 0.2),
+        max_tokens=cfg['llm'].get('max_tokens', 4000),
+        stream=True,
+        stream_options={'include_usage': True},
+        **_timeout_kwargs(timeout),
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if getattr(chunk, 'usage', None) is not None and usage is not None:
+            usage.update(_openai_usage(chunk.usage))
+
+
+def _stream_anthropic(prompt: Prompt, cfg: dict, timeout: Optional[float] = None,
+                      usage: Optional[dict] = None) -> Iterator[str]:
+    client = get_client(cfg, 'anthropic')
+    with client.messages.stream(
+        model=cfg['llm']['model'],
+        max_tokens=cfg['llm'].get('max_tokens', 4000),
+        temperature=cfg['llm'].get('temperature', 0.2),
+        system=_anthropic_system(prompt),
+        messages=[{'role': 'user', 'content': prompt.user}],
+        **_timeout_kwargs(timeout),
+    ) as stream:
+        yield from stream.text_stream
+        if usage is not None:
+            usage.update(_anthropic_usage(stream.get_final_message().usage))
+
+
+def _response_key(prompt: Prompt, cfg: dict) -> str:
+    llm = cfg['llm']
+    return hash_key(
+        'llm', llm['provider'], llm.get('model', ''), llm.get('temperature', 0.2),
+        llm.get('max_tokens', 4000), prompt.system, prompt.user,
+    )
+
+
+def _open_llm_cache(cfg: dict):
+    return open_cache(cfg, 'llm', default_mb=512) if cfg['llm'].get('cache', True) else None
+
+
+def _cached_response(cache, key: str, run_dir: Optional[Path]) -> Optional[str]:
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    try:
+        output = (entry / 'response.txt').read_text(encoding='utf-8')
+    except OSError:
+        cache.discard(key)
+        return None
+    if run_dir:
+        bump_run_counters(run_dir, 'llm_cache', hits=1)
+    return output
 
 
-def _call_llm(prompt: str, cfg: dict) -> str:
+def _store_response(cache, key: str, prompt: Prompt, output: str, cfg: dict, run_dir: Optional[Path]) -> None:
+    if run_dir:
+        bump_run_counters(run_dir, 'llm_cache', misses=1)
+    if not output:
+        return
+    staging = cache.staging_dir()
+    (staging / 'response.txt').write_text(output, encoding='utf-8')
+    cache.commit(key, staging, {
+        'provider': cfg['llm']['provider'],
+        'model': cfg['llm'].get('model', ''),
+        'prompt_chars': len(prompt.system) + len(prompt.user),
+    })
+
+
+def _call_llm(prompt: Prompt, cfg: dict, run_dir: Optional[Path] = None, kind: str = 'call') -> str:
+    """Call the configured provider through the on-disk response cache.
+
+    Responses are keyed by (provider, model, temperature, max_tokens,
+    prompt). ``llm.cache: false`` bypasses the cache; hits and misses are
+    counted under ``llm_cache`` in ``run_dir/meta.json``. Every call, hit or
+    not, is recorded by :mod:`core.telemetry` under ``kind``.
+    """
+    record = telemetry.start_call(kind, prompt, cfg)
+    cache = _open_llm_cache(cfg)
+    if cache is not None:
+        key = _response_key(prompt, cfg)
+        output = _cached_response(cache, key, run_dir)
+        if output is not None:
+            record['response_cache'] = True
+            telemetry.finish_call(run_dir, record, cfg)
+            return output
+
+    try:
+        output, usage = _resilient_llm(prompt, cfg, run_dir, record)
+    except Exception as exc:
+        telemetry.finish_call(run_dir, record, cfg, error=exc)
+        raise
+    telemetry.finish_call(run_dir, record, cfg, usage)
+    if cache is not None:
+        _store_response(cache, key, prompt, output, cfg, run_dir)
+    return output
+
+
+def _stream_llm(prompt: Prompt, cfg: dict, run_dir: Optional[Path] = None,
+                kind: str = 'call') -> Iterator[str]:
+    """Streaming counterpart of :func:`_call_llm`; yields text chunks.
+
+    A cache hit is yielded as a single chunk. A streamed response is only
+    stored once it has been read to the end. The telemetry record also
+    carries the time to the first chunk.
+    """
+    record = telemetry.start_call(kind, prompt, cfg, stream=True)
+    cache = _open_llm_cache(cfg)
+    key = _response_key(prompt, cfg) if cache is not None else None
+    if cache is not None:
+        output = _cached_response(cache, key, run_dir)
+        if output is not None:
+            record['response_cache'] = True
+            telemetry.mark_first_token(record)
+            telemetry.finish_call(run_dir, record, cfg)
+            yield output
+            return
+
+    parts = []
+    usage = {}
+    try:
+        for chunk in _resilient_stream(prompt, cfg, run_dir, usage, record):
+            telemetry.mark_first_token(record)
+            parts.append(chunk)
+            yield chunk
+    except Exception as exc:
+        telemetry.finish_call(run_dir, record, cfg, usage, exc)
+        raise
+    telemetry.finish_call(run_dir, record, cfg, usage)
+    if cache is not None:
+        _store_response(cache, key, prompt, ''.join(parts), cfg, run_dir)
+
+
+def _dispatch_stream(prompt: Prompt, cfg: dict, timeout: Optional[float] = None,
+                     usage: Optional[dict] = None) -> Iterator[str]:
+    provider = cfg['llm']['provider']
+    if provider in ('openai', 'deepseek'):
+        return _stream_openai(prompt, cfg, provider, timeout, usage)
+    if provider == 'anthropic':
+        return _stream_anthropic(prompt, cfg, timeout, usage)
+    if provider == 'mock':
+        return mock_llm.stream_mock(prompt, cfg, timeout, usage)
+    raise ValueError('Unsupported LLM provider')
+
+
+def _iter_frames(chunks: Iterable[str]) -> Iterator[str]:
+    """Yield every frame from a stream of text chunks as soon as it closes.
+
+    Only the text after the last emitted frame is rescanned, and only when a
+    chunk contains ``}`` (every frame ends with one), so the scan stays
+    cheap however many small chunks the provider sends.
+    """
+    tail = ''
+    for chunk in chunks:
+        tail += chunk
+        if '}' not in chunk:
+            continue
+        spans = scan_frames(tail)
+        for start, end in spans:
+            yield tail[start:end]
+        if spans:
+            tail = tail[spans[-1][1]:]
+
+
+def _backup_cfg(cfg: dict, hedge: dict) -> dict:
+    """``cfg`` with the provider/model fields replaced by ``llm.hedge``.
+
+    Blank hedge fields fall back to the primary's values only when both use
+    the same provider; a different provider never inherits the primary's
+    key or endpoint.
+    """
+    llm = dict(cfg['llm'])
+    same = hedge.get('provider', llm['provider']) == llm['provider']
+    for name in ('provider', 'model', 'api_key', 'base_url'):
+        value = hedge.get(name)
+        if value or not same:
+            llm[name] = value or ''
+    return {**cfg, 'llm': llm}
+
+
+def _resilient_llm(prompt: Prompt, cfg: dict, run_dir: Optional[Path] = None,
+                   record: Optional[dict] = None) -> tuple:
+    """Dispatch with retries under ``llm.retry`` and optional hedging.
+
+    With ``llm.hedge.enabled`` a second request goes to the backup provider
+    once the primary has run longer than its recent ``hedge.percentile``
+    latency (``hedge.delay`` until ``hedge.min_samples`` calls are known),
+    and the first answer wins. Returns ``(text, usage)``; ``usage`` names the
+    provider and model that answered.
+    """
+    llm = cfg['llm']
+    key = (llm['provider'], llm.get('model', ''))
+
+    def leg(leg_cfg: dict) -> tuple:
+        text, usage = call_with_retry(
+            lambda timeout: _dispatch_llm(prompt, leg_cfg, timeout), leg_cfg, run_dir, stats=record)
+        return text, {**usage, 'provider': leg_cfg['llm']['provider'], 'model': leg_cfg['llm'].get('model', '')}
+
+    def primary() -> tuple:
+        start = time.monotonic()
+        output = leg(cfg)
+        LATENCY.record(key, time.monotonic() - start)
+        return output
+
+    hedge = hedge_settings(cfg)
+    if not hedge['enabled']:
+        return primary()
+
+    backup_cfg = _backup_cfg(cfg, hedge)
+    delay = LATENCY.percentile(key, float(hedge['percentile']), int(hedge['min_samples']))
+    return hedged_call(primary, lambda: leg(backup_cfg), float(hedge['delay']) if delay is None else delay,
+                       run_dir, stats=record)
+
+
+def _resilient_stream(prompt: Prompt, cfg: dict, run_dir: Optional[Path] = None,
+                      usage: Optional[dict] = None, record: Optional[dict] = None) -> Iterator[str]:
+    """Streaming dispatch; failures before the first chunk are retried.
+
+    Once text has been yielded a retry would duplicate it, so later errors
+    propagate. Streams are not hedged.
+    """
+    def open_stream(timeout: float) -> tuple:
+        chunks = _dispatch_stream(prompt, cfg, timeout, usage)
+        return next(chunks, None), chunks
+
+    first, chunks = call_with_retry(open_stream, cfg, run_dir, stats=record)
+    if first is not None:
+        yield first
+        yield from chunks
+
+
+def _dispatch_llm(prompt: Prompt, cfg: dict, timeout: Optional[float] = None) -> tuple:
     provider = cfg['llm']['provider']
     if provider == 'openai':
-        return _call_openai(prompt, cfg)
+        return _call_openai(prompt, cfg, timeout)
     if provider == 'anthropic':
-        return _call_anthropic(prompt, cfg)
+        return _call_anthropic(prompt, cfg, timeout)
     if provider == 'deepseek':
-        return _call_deepseek(prompt, cfg)
+        return _call_deepseek(prompt, cfg, timeout)
+    if provider == 'mock':
+        return mock_llm.call_mock(prompt, cfg, timeout)
     raise ValueError('Unsupported LLM provider')
 
 
-def _call_deepseek(prompt: str, cfg: dict) -> str:
+def _call_deepseek(prompt: Prompt, cfg: dict, timeout: Optional[float] = None) -> tuple:
     """调用DeepSeek API（使用OpenAI兼容格式）"""
-    try:
-        from openai import OpenAI
-    except Exception as exc:
-        raise RuntimeError('openai package is required for DeepSeek') from exc
-
-    # DeepSeek使用OpenAI兼容的API
-    client = OpenAI(
-        api_key=cfg['llm']['api_key'],
-        base_url='https://api.deepseek.com'
-    )
-    
+    # DeepSeek使用OpenAI兼容的API，客户端由providers按base_url复用
+    client = get_client(cfg, 'deepseek')
     resp = client.chat.completions.create(
         model=cfg['llm'].get('model', 'deepseek-chat'),
-        messages=[{'role': 'user', 'content': prompt}],
+        messages=_openai_messages(prompt),
         temperature=cfg['llm'].get('temperature', 0.2),
         max_tokens=cfg['llm'].get('max_tokens', 4000),
+        **_timeout_kwargs(timeout),
     )
-    return resp.choices[0].message.content
+    return resp.choices[0].message.content, _openai_usage(resp.usage)
 
 
-def generate_beamer_body(paper_tex: str, agents_path: Path, cfg: dict, run_dir: Path) -> str:
-    agents_text = agents_path.read_text(encoding='utf-8', errors='ignore')
-    prompt = _build_prompt(agents_text, paper_tex)
+async def _acall_openai(prompt: Prompt, cfg: dict, provider: str = 'openai',
+                        timeout: Optional[float] = None) -> tuple:
+    client = get_async_client(cfg, provider)
+    default_model = 'deepseek-chat' if provider == 'deepseek' else None
+    resp = await client.chat.completions.create(
+        model=cfg['llm'].get('model', default_model),
+        messages=_openai_messages(prompt),
+        temperature=cfg['llm'].get('temperature', 0.2),
+        max_tokens=cfg['llm'].get('max_tokens', 4000),
+        **_timeout_kwargs(timeout),
+    )
+    return resp.choices[0].message.content, _openai_usage(resp.usage)
+
+
+async def _acall_anthropic(prompt: Prompt, cfg: dict, timeout: Optional[float] = None) -> tuple:
+    client = get_async_client(cfg, 'anthropic')
+    resp = await client.messages.create(
+        model=cfg['llm']['model'],
+        max_tokens=cfg['llm'].get('max_tokens', 4000),
+        temperature=cfg['llm'].get('temperature', 0.2),
+        system=_anthropic_system(prompt),
+        messages=[{'role': 'user', 'content': prompt.user}],
+        **_timeout_kwargs(timeout),
+    )
+    return resp.content[0].text, _anthropic_usage(resp.usage)
+
+
+async def _astream_openai(prompt: Prompt, cfg: dict, provider: str = 'openai',
+                          timeout: Optional[float] = None, usage: Optional[dict] = None) -> AsyncIterator[str]:
+    client = get_async_client(cfg, provider)
+    default_model = 'deepseek-chat' if provider == 'deepseek' else None
+    stream = await client.chat.completions.create(
+        model=cfg['llm'].get('model', default_model),
+        messages=_openai_messages(prompt),
+        temperature=cfg['llm'].get('temperature', 0.2),
+        max_tokens=cfg['llm'].get('max_tokens', 4000),
+        stream=True,
+        stream_options={'include_usage': True},
+        **_timeout_kwargs(timeout),
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if getattr(chunk, 'usage', None) is not None and usage is not None:
+            usage.update(_openai_usage(chunk.usage))
+
+
+async def _astream_anthropic(prompt: Prompt, cfg: dict, timeout: Optional[float] = None,
+                             usage: Optional[dict] = None) -> AsyncIterator[str]:
+    client = get_async_client(cfg, 'anthropic')
+    async with client.messages.stream(
+        model=cfg['llm']['model'],
+        max_tokens=cfg['llm'].get('max_tokens', 4000),
+        temperature=cfg['llm'].get('temperature', 0.2),
+        system=_anthropic_system(prompt),
+        messages=[{'role': 'user', 'content': prompt.user}],
+        **_timeout_kwargs(timeout),
+    ) as stream:
+        async for text in stream.text_stream:
+            yield text
+        if usage is not None:
+            usage.update(_anthropic_usage((await stream.get_final_message()).usage))
+
+
+def _adispatch_llm(prompt: Prompt, cfg: dict, timeout: Optional[float] = None) -> Awaitable:
+    provider = cfg['llm']['provider']
+    if provider in ('openai', 'deepseek'):
+        return _acall_openai(prompt, cfg, provider, timeout)
+    if provider == 'anthropic':
+        return _acall_anthropic(prompt, cfg, timeout)
+    if provider == 'mock':
+        return mock_llm.acall_mock(prompt, cfg, timeout)
+    raise ValueError('Unsupported LLM provider')
+
+
+def _adispatch_stream(prompt: Prompt, cfg: dict, timeout: Optional[float] = None,
+                      usage: Optional[dict] = None) -> AsyncIterator[str]:
+    provider = cfg['llm']['provider']
+    if provider in ('openai', 'deepseek'):
+        return _astream_openai(prompt, cfg, provider, timeout, usage)
+    if provider == 'anthropic':
+        return _astream_anthropic(prompt, cfg, timeout, usage)
+    if provider == 'mock':
+        return mock_llm.astream_mock(prompt, cfg, timeout, usage)
+    raise ValueError('Unsupported LLM provider')
+
+
+async def acall_llm(prompt: Prompt, cfg: dict, run_dir: Optional[Path] = None, kind: str = 'call') -> str:
+    """Async counterpart of :func:`_call_llm` on the providers' native async clients.
+
+    Shares the response cache, retry policy and telemetry with the sync
+    path; requests are not hedged.
+    """
+    record = telemetry.start_call(kind, prompt, cfg)
+    cache = _open_llm_cache(cfg)
+    if cache is not None:
+        key = _response_key(prompt, cfg)
+        output = _cached_response(cache, key, run_dir)
+        if output is not None:
+            record['response_cache'] = True
+            telemetry.finish_call(run_dir, record, cfg)
+            return output
+
+    try:
+        output, usage = await acall_with_retry(
+            lambda timeout: _adispatch_llm(prompt, cfg, timeout), cfg, run_dir, stats=record)
+    except Exception as exc:
+        telemetry.finish_call(run_dir, record, cfg, error=exc)
+        raise
+    telemetry.finish_call(run_dir, record, cfg, usage)
+    if cache is not None:
+        _store_response(cache, key, prompt, output, cfg, run_dir)
+    return output
+
+
+async def astream_llm(prompt: Prompt, cfg: dict, run_dir: Optional[Path] = None,
+                      kind: str = 'call') -> AsyncIterator[str]:
+    """Async counterpart of :func:`_stream_llm`; failures before the first chunk are retried."""
+    record = telemetry.start_call(kind, prompt, cfg, stream=True)
+    cache = _open_llm_cache(cfg)
+    key = _response_key(prompt, cfg) if cache is not None else None
+    if cache is not None:
+        output = _cached_response(cache, key, run_dir)
+        if output is not None:
+            record['response_cache'] = True
+            telemetry.mark_first_token(record)
+            telemetry.finish_call(run_dir, record, cfg)
+            yield output
+            return
+
+    usage = {}
+
+    async def open_stream(timeout: float) -> tuple:
+        chunks = _adispatch_stream(prompt, cfg, timeout, usage)
+        return await anext(chunks, None), chunks
+
+    parts = []
+    try:
+        first, chunks = await acall_with_retry(open_stream, cfg, run_dir, stats=record)
+        if first is not None:
+            telemetry.mark_first_token(record)
+            parts.append(first)
+            yield first
+            async for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+    except Exception as exc:
+        telemetry.finish_call(run_dir, record, cfg, usage, exc)
+        raise
+    telemetry.finish_call(run_dir, record, cfg, usage)
+    if cache is not None:
+        _store_response(cache, key, prompt, ''.join(parts), cfg, run_dir)
+
+
+async def acall_many(prompts: list, cfg: dict, run_dir: Optional[Path] = None, kind: str = 'call',
+                     concurrency: Optional[int] = None) -> list:
+    """Run :func:`acall_llm` for every prompt with at most ``concurrency`` in flight.
+
+    ``concurrency`` defaults to ``llm.max_concurrency``. Results keep the
+    order of ``prompts``; a failed call yields its exception in place.
+    """
+    limit = asyncio.Semaphore(max(1, int(concurrency or cfg['llm'].get('max_concurrency', 8))))
+
+    async def one(prompt: Prompt):
+        async with limit:
+            return await acall_llm(prompt, cfg, run_dir, kind)
+
+    return await asyncio.gather(*(one(p) for p in prompts), return_exceptions=True)
+
+
+def generate_beamer_body(paper_tex: str, agents_path: Path, cfg: dict, run_dir: Path,
+                         on_frame: Optional[Callable[[str], None]] = None) -> str:
+    """Generate the Beamer body for ``paper_tex``.
+
+    With ``on_frame`` every frame is passed to the callback, in deck order,
+    as soon as it is complete; with ``generation.stream`` (the default) the
+    single-call mode streams tokens so the first frame arrives long before
+    the whole body. The full body is still returned at the end.
+    """
+    agents_text = _load_agents(agents_path)
 
     if run_dir:
         run_dir.mkdir(parents=True, exist_ok=True)
         (run_dir / 'input_paper.tex').write_text(paper_tex, encoding='utf-8')
-        (run_dir / 'prompt.txt').write_text(prompt, encoding='utf-8')
 
-    output = _call_llm(prompt, cfg)
+    gen_cfg = cfg.get('generation') or {}
+    if gen_cfg.get('mode') == 'sections':
+        output = _generate_by_sections(paper_tex, agents_text, cfg, run_dir, on_frame)
+        if run_dir:
+            (run_dir / 'output_body.tex').write_text(output, encoding='utf-8')
+        return _wrap_document(output)
+
+    prompt = _build_prompt(agents_text, paper_tex)
+    if run_dir:
+        (run_dir / 'prompt.txt').write_text(str(prompt), encoding='utf-8')
+
+    if on_frame is None:
+        output = _call_llm(prompt, cfg, run_dir, 'generate')
+    else:
+        parts = []
+
+        def collect(chunks: Iterable[str]) -> Iterator[str]:
+            for chunk in chunks:
+                parts.append(chunk)
+                yield chunk
+
+        if gen_cfg.get('stream', True):
+            chunks = _stream_llm(prompt, cfg, run_dir, 'generate')
+        else:
+            chunks = [_call_llm(prompt, cfg, run_dir, 'generate')]
+        for frame in _iter_frames(collect(chunks)):
+            on_frame(frame)
+        output = ''.join(parts)
 
     if run_dir:
         (run_dir / 'output_body.tex').write_text(output, encoding='utf-8')
 
-    if '\\begin{document}' not in output:
-        output = '\n'.join([
-            r'\\begin{document}',
-            output.strip(),
-            r'\\end{document}',
-        ])
+    return _wrap_document(output)
+
+
+def _generate_by_sections(paper_tex: str, agents_text: str, cfg: dict, run_dir: Path,
+                          on_frame: Optional[Callable[[str], None]] = None) -> str:
+    """Map-reduce generation: one concurrent call per section plus an outline call.
+
+    The outline call only needs the section titles, so it runs alongside the
+    section calls and wall-clock time follows the slowest single section.
+    ``on_frame`` receives the opening frames, then each section's frames as
+    soon as that section and all earlier ones are done.
+    """
+    gen_cfg = cfg.get('generation') or {}
+    context, sections = _split_sections(paper_tex, int(gen_cfg.get('min_section_chars', 1500)))
+    context = context[:int(gen_cfg.get('context_chars', 6000))]
+    total = len(sections)
+
+    log_dir = run_dir / 'sections' if run_dir else None
+    if log_dir:
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+    def run(name: str, prompt: Prompt) -> str:
+        if log_dir:
+            (log_dir / f'{name}_prompt.txt').write_text(str(prompt), encoding='utf-8')
+        output = _call_llm(prompt, cfg, run_dir, 'outline' if name == 'outline' else 'section')
+        if log_dir:
+            (log_dir / f'{name}_output.tex').write_text(output, encoding='utf-8')
+        return output
+
+    system = _build_sections_system(agents_text, context)
+    workers = max(1, int(gen_cfg.get('max_workers', 4)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        outline = pool.submit(run, 'outline', _build_outline_prompt(system, [t for t, _ in sections], agents_text))
+        futures = [
+            pool.submit(run, f'section_{i:02d}', _build_section_prompt(system, title, text, i, total, agents_text))
+            for i, (title, text) in enumerate(sections, 1)
+        ]
+        opening, _, closing = outline.result().partition(SECTIONS_MARKER)
+        parts = [_frames_only(opening)]
+        _emit_frames(parts[-1], on_frame)
+        for future in futures:
+            parts.append(_frames_only(future.result()))
+            _emit_frames(parts[-1], on_frame)
+        parts.append(_frames_only(closing))
+        _emit_frames(parts[-1], on_frame)
+
+    return '\n\n'.join(p for p in parts if p)
 
-    return output
 
+def _emit_frames(text: str, on_frame: Optional[Callable[[str], None]]) -> None:
+    if on_frame is not None:
+        for frame in FrameIndex(text):
+            on_frame(frame)
 
-def fix_single_frame(frame_tex: str, agents_path: Path, cfg: dict, run_dir: Path, frame_index: int) -> str:
-    agents_text = agents_path.read_text(encoding='utf-8', errors='ignore')
-    prompt = _build_fix_prompt(agents_text, frame_tex)
+
+def fix_single_frame(frame_tex: str, agents_path: Path, cfg: dict, run_dir: Path, frame_index: int,
+                     notes: Optional[list] = None) -> str:
+    prompt = _build_fix_prompt(_load_agents(agents_path), frame_tex, notes)
 
     if run_dir:
         fname = f'fix_prompt_{frame_index:03d}.txt'
-        (run_dir / fname).write_text(prompt, encoding='utf-8')
+        (run_dir / fname).write_text(str(prompt), encoding='utf-8')
 
-    output = _call_llm(prompt, cfg)
+    output = _call_llm(prompt, cfg, run_dir, 'fix')
 
     if run_dir:
         fname = f'fix_output_{frame_index:03d}.tex'
         (run_dir / fname).write_text(output, encoding='utf-8')
 
     return output
+
+
+@dataclass
+class FrameFix:
+    index: int
+    output: str = ''
+    frames: int = 0
+    error: str = ''
+
+    @property
+    def ok(self) -> bool:
+        return not self.error
+
+
+def _fix_limiter(cfg: dict) -> RateLimiter:
+    llm = cfg['llm']
+    rpm = float((cfg.get('fix') or {}).get('rpm', 0) or 0)
+    key = (llm['provider'], llm.get('model', ''), rpm)
+    with _FIX_LIMITERS_LOCK:
+        limiter = _FIX_LIMITERS.get(key)
+        if limiter is None:
+            limiter = _FIX_LIMITERS[key] = RateLimiter(rpm)
+    return limiter
+
+
+def fix_frames(frames: FrameIndex, indices: list, agents_path: Path, cfg: dict, run_dir: Path,
+               notes: Optional[dict] = None) -> list:
+    """Fix several frames concurrently and splice the results into ``frames``.
+
+    ``indices`` are 0-based positions in ``frames``; ``notes`` optionally
+    maps an index to problem descriptions added to its prompt. Calls run on
+    up to ``fix.max_workers`` threads and start no faster than ``fix.rpm``
+    per minute across all callers using the same provider and model. Successful outputs are spliced in one pass, last index first so
+    earlier positions stay valid when a fix splits a frame in two; failed
+    frames are left untouched. Returns one :class:`FrameFix` per index,
+    sorted by index, so the caller can report failures and recompile once.
+    """
+    fix_cfg = cfg.get('fix') or {}
+    limiter = _fix_limiter(cfg)
+    indices = sorted(set(indices))
+    sources = {i: frames[i] for i in indices}
+
+    def run(i: int) -> FrameFix:
+        limiter.acquire()
+        try:
+            output = fix_single_frame(sources[i], agents_path, cfg, run_dir, i + 1, (notes or {}).get(i))
+        except Exception as exc:
+            return FrameFix(i, error=str(exc) or exc.__class__.__name__)
+        return FrameFix(i, output=_frames_only(output))
+
+    workers = max(1, int(fix_cfg.get('max_workers', 4)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run, indices))
+
+    for result in reversed(results):
+        if not result.ok:
+            continue
+        try:
+            result.frames = frames.replace(result.index, result.output)
+        except ValueError as exc:
+            result.error = str(exc)
+    return results
@@ -0,0 +1,136 @@
+"""Layout problems read straight from ``main.log``.
+
+Overfull/underfull boxes and missing-file errors are mapped to the page
+they were shipped out on (the ``[N]`` markers TeX prints) and to the
+frame they belong to, so overflowing slides are found without rendering.
+"""
+import json
+import re
+from bisect import bisect_right
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Optional
+
+from core.frames import FrameIndex
+
+
+ISSUES_NAME = 'compile_issues.json'
+
+BOX_RE = re.compile(
+    r'^(?P<kind>Overfull|Underfull) \\(?P<box>[hv])box '
+    r'\((?:(?P<points>\d+(?:\.\d+)?)pt too (?:wide|high)|badness (?P<badness>\d+))\)'
+    r'(?: (?:in paragraph|in alignment|detected) at lines? (?P<line>\d+))?'
+)
+MISSING_RE = re.compile(r"^! (?:LaTeX|Package [\w.]+) Error: File `(?P<file>[^']*)' not found")
+ERROR_RE = re.compile(r'^! (?P<message>.*)')
+ERROR_LINE_RE = re.compile(r'^l\.(?P<line>\d+)')
+SHIPOUT_RE = re.compile(r'\[(?P<page>\d+)(?=[\s\]<{]|$)')
+
+
+@dataclass
+class LogIssue:
+    kind: str                    # overfull_vbox, overfull_hbox, underfull_vbox, underfull_hbox, missing_file, error
+    message: str
+    points: float = 0.0          # how far an overfull box sticks out
+    badness: int = 0             # underfull boxes report badness instead
+    line: Optional[int] = None   # line in main.tex
+    page: Optional[int] = None   # page the problem was shipped out on
+    frame: Optional[int] = None  # 0-based frame index in the body
+
+    @property
+    def overflow(self) -> bool:
+        return self.kind.startswith('overfull')
+
+
+def parse_log(log: str) -> list:
+    """Return :class:`LogIssue` items (without frames) in log order."""
+    issues = []
+    pending = []
+    last_page = None
+    awaiting_line = None
+    for text in log.splitlines():
+        m = BOX_RE.match(text)
+        if m:
+            issue = LogIssue(
+                kind=f"{m.group('kind').lower()}_{m.group('box')}box",
+                message=text.strip(),
+                points=float(m.group('points') or 0.0),
+                badness=int(m.group('badness') or 0),
+                line=int(m.group('line')) if m.group('line') else None,
+            )
+            pending.append(issue)
+            continue
+        m = MISSING_RE.match(text) or ERROR_RE.match(text)
+        if m:
+            kind = 'missing_file' if 'file' in m.groupdict() else 'error'
+            awaiting_line = LogIssue(kind=kind, message=text[2:].strip())
+            pending.append(awaiting_line)
+            continue
+        if awaiting_line is not None:
+            m = ERROR_LINE_RE.match(text)
+            if m:
+                awaiting_line.line = int(m.group('line'))
+                awaiting_line = None
+                continue
+        for m in SHIPOUT_RE.finditer(text):
+            page = int(m.group('page'))
+            # Box dumps can contain "[n" too; real shipouts are consecutive.
+            if last_page is not None and page != last_page + 1:
+                continue
+            for issue in pending:
+                issue.page = page
+            issues.extend(pending)
+            pending = []
+            last_page = page
+    return issues + pending
+
+
+def assign_frames(issues: list, body: str, first_line: int, pages: Optional[list] = None) -> list:
+    """Fill in ``LogIssue.frame`` from the main.tex line or the frame-to-page map.
+
+    ``body`` is the deck body, starting at line ``first_line`` of main.tex.
+    Vertical boxes are reported when the page is shipped out, so they use
+    the page; everything else uses its line when known.
+    """
+    frames = FrameIndex(body)
+    starts = []
+    ends = []
+    for i in range(len(frames)):
+        start, end = frames.span(i)
+        starts.append(first_line + body.count('\n', 0, start))
+        ends.append(first_line + body.count('\n', 0, end))
+    if pages is not None and len(pages) != len(frames):
+        pages = None
+
+    for issue in issues:
+        frame = None
+        if issue.line is not None and not issue.kind.endswith('vbox'):
+            i = bisect_right(starts, issue.line) - 1
+            if i >= 0 and issue.line <= ends[i]:
+                frame = i
+        if frame is None and issue.page is not None and pages:
+            frame = next((i for i, (a, b) in enumerate(pages) if a <= issue.page <= b), None)
+        issue.frame = frame
+    return issues
+
+
+def write_issues(work_dir: Path, issues: list) -> None:
+    (work_dir / ISSUES_NAME).write_text(json.dumps([asdict(i) for i in issues], ensure_ascii=False, indent=1),
+                                       encoding='utf-8')
+
+
+def load_issues(work_dir: Path) -> list:
+    try:
+        data = json.loads((work_dir / ISSUES_NAME).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return []
+    return [LogIssue(**d) for d in data]
+
+
+def frame_summary(issues: list) -> dict:
+    """``{frame: [issues]}`` for issues that could be placed on a frame."""
+    summary: dict = {}
+    for issue in issues:
+        if issue.frame is not None:
+            summary.setdefault(issue.frame, []).append(issue)
+    return summary
@@ -0,0 +1,226 @@
+"""Localize a failing compile to the frames that break it.
+
+The frames are split into ``bisect.fanout`` groups that are compiled
+concurrently as small stand-alone decks (the preamble comes from the cached
+format, see :mod:`core.compiler`). Groups that fail are split again in the
+next round until single frames remain, so ``n`` frames need about
+``log_fanout(n)`` rounds of parallel compiles. The broken frames are then
+either replaced by placeholders (``quarantine``) or sent to the fixer first
+(``fix``) and quarantined only if they still fail.
+"""
+import json
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from core.compile_pool import latex_settings
+from core.compiler import CompileError, CompileResult, compile_latex
+from core.frames import FrameIndex
+from core.generator import fix_frames
+from utils.run_meta import update_run_meta
+
+
+DEFAULT_BISECT = {
+    'recovery': 'quarantine',  # quarantine, fix or off
+    'fanout': 4,               # groups per failing set and round
+}
+BISECT_DIR = 'bisect'
+NO_OUTPUT = 'No pages of output'
+PROBE_FRAME = '\\begin{frame}\\end{frame}'
+PLACEHOLDER = '\n'.join([
+    '\\begin{{frame}}{{Frame {number}}}',
+    '  \\centering',
+    '  This frame did not compile and was left out.',
+    '\\end{{frame}}',
+])
+
+
+@dataclass
+class Localization:
+    bad: list                                   # 0-based frame indices
+    errors: dict = field(default_factory=dict)  # frame -> error messages from its own compile
+    rounds: int = 0
+    compiles: int = 0
+    preamble_error: str = ''                    # set when even the deck without frames fails
+
+
+@dataclass
+class Recovery:
+    frames: FrameIndex
+    result: Optional[CompileResult]
+    localization: Localization
+    fixed: list = field(default_factory=list)
+    quarantined: list = field(default_factory=list)
+
+
+def settings(cfg: dict) -> dict:
+    return {**DEFAULT_BISECT, **(cfg.get('bisect') or {})}
+
+
+def _split(items: list, parts: int) -> list:
+    size = -(-len(items) // max(2, parts))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _subset_body(frames: FrameIndex, indices: Optional[list]) -> str:
+    """The deck body with every frame outside ``indices`` removed.
+
+    The text between frames (``\\section``, ``\\newcommand``,
+    ``\\setbeamertemplate``, ...) is kept so frames that depend on it still
+    compile. ``indices=None`` keeps only that text plus an empty probe frame,
+    because a deck without pages produces no PDF.
+    """
+    keep = set(indices or [])
+    parts = [frames.gaps[0]]
+    for i, gap in enumerate(frames.gaps[1:]):
+        if i in keep:
+            parts.append(frames[i])
+        elif indices is None and i == 0:
+            parts.append(PROBE_FRAME)
+        parts.append(gap)
+    return ''.join(parts)
+
+
+def _try_compile(body: str, job_dir: Path, template_path: str, work_dir: Path, cfg: dict) -> list:
+    """Compile ``body`` in ``job_dir``; returns ``[]`` on success, else the error messages."""
+    job_dir.mkdir(parents=True, exist_ok=True)
+    talk_tex = job_dir / 'talk.tex'
+    talk_tex.write_text(body, encoding='utf-8')
+    try:
+        # Probe decks are throwaway; caching them would only evict useful entries.
+        compile_latex(talk_tex, template_path, job_dir, cfg, owner=str(work_dir), max_passes=1,
+                      asset_root=work_dir, use_cache=False)
+    except CompileError as exc:
+        errors = [i.message for i in exc.issues if i.kind in ('error', 'missing_file')]
+        return errors or [str(exc).splitlines()[0]]
+    except FileNotFoundError as exc:
+        log = job_dir / 'main.log'
+        if log.exists() and NO_OUTPUT in log.read_text(encoding='utf-8', errors='ignore'):
+            # Nothing in the subset ships a page (e.g. only \\section commands).
+            return []
+        return [str(exc) or exc.__class__.__name__]
+    except RuntimeError as exc:
+        return [str(exc) or exc.__class__.__name__]
+    return []
+
+
+def localize_failures(frames: FrameIndex, template_path: str, work_dir: Path, cfg: dict) -> Localization:
+    """Find the frames that fail to compile on their own, in parallel rounds."""
+    fanout = max(2, int(settings(cfg)['fanout']))
+    workers = max(1, int(latex_settings(cfg)['max_workers']))
+    root = work_dir / BISECT_DIR
+    if root.exists():
+        shutil.rmtree(root, ignore_errors=True)
+    found = Localization(bad=[])
+
+    def job(number: int, indices: Optional[list]) -> list:
+        body = _subset_body(frames, indices)
+        return _try_compile(body, root / f'job_{number:03d}', template_path, work_dir, cfg)
+
+    with ThreadPoolExecutor(max_workers=workers + 1) as pool:
+        # The frameless deck runs alongside the first round: if the preamble
+        # or the text between frames is broken, no frame is to blame.
+        empty = pool.submit(job, 0, None)
+        found.compiles += 1
+        pending = _split(list(range(len(frames))), fanout) if len(frames) else []
+        while pending:
+            found.rounds += 1
+            numbers = range(found.compiles, found.compiles + len(pending))
+            results = list(pool.map(job, numbers, pending))
+            found.compiles += len(pending)
+            if found.rounds == 1:
+                errors = empty.result()
+                if errors:
+                    found.preamble_error = '\n'.join(errors)
+                    return found
+            nxt = []
+            for group, errors in zip(pending, results):
+                if not errors:
+                    continue
+                if len(group) == 1:
+                    found.bad.append(group[0])
+                    found.errors[group[0]] = errors
+                else:
+                    nxt.extend(_split(group, fanout))
+            pending = nxt
+        if not found.rounds:
+            # No frames at all: the frameless deck is the only verdict.
+            errors = empty.result()
+            if errors:
+                found.preamble_error = '\n'.join(errors)
+    found.bad.sort()
+    return found
+
+
+def quarantine(frames: FrameIndex, indices: list) -> FrameIndex:
+    """Return a copy of ``frames`` with ``indices`` replaced by placeholder frames."""
+    deck = FrameIndex(frames.text())
+    for i in sorted(indices, reverse=True):
+        deck.replace(i, PLACEHOLDER.format(number=i + 1))
+    return deck
+
+
+def recover_deck(frames: FrameIndex, template_path: str, work_dir: Path, run_dir: Path, cfg: dict,
+                 agents_path: Path) -> Recovery:
+    """Localize the frames breaking the compile, repair or quarantine them and compile the deck.
+
+    With ``bisect.recovery: fix`` the broken frames go through
+    :func:`core.generator.fix_frames` (with their errors in the prompt)
+    first; frames that still fail afterwards are quarantined. The original
+    frames of quarantined slides are kept in ``run_dir/quarantine``.
+    """
+    start = time.monotonic()
+    mode = settings(cfg)['recovery']
+    found = localize_failures(frames, template_path, work_dir, cfg)
+    recovery = Recovery(frames, None, found)
+    if found.preamble_error or not found.bad:
+        _log(run_dir, recovery, start)
+        return recovery
+
+    deck = FrameIndex(frames.text())
+    bad = found.bad
+    if mode == 'fix':
+        notes = {i: found.errors.get(i, []) for i in bad}
+        fixes = fix_frames(deck, bad, agents_path, cfg, run_dir, notes)
+        # Fixes may split frames; localize again on the repaired deck.
+        bad = localize_failures(deck, template_path, work_dir, cfg).bad
+        if len(deck) == len(frames):
+            recovery.fixed = [i for i in found.bad if i not in bad]
+        else:
+            recovery.fixed = [f.index for f in fixes if f.ok]
+
+    if bad:
+        out_dir = run_dir / 'quarantine'
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for i in bad:
+            (out_dir / f'frame_{i + 1:03d}.tex').write_text(deck[i], encoding='utf-8')
+        deck = quarantine(deck, bad)
+        recovery.quarantined = bad
+
+    talk_tex = work_dir / 'talk.tex'
+    talk_tex.write_text(deck.text(), encoding='utf-8')
+    recovery.frames = deck
+    recovery.result = compile_latex(talk_tex, template_path, work_dir, cfg)
+    _log(run_dir, recovery, start)
+    return recovery
+
+
+def _log(run_dir: Path, recovery: Recovery, start: float) -> None:
+    found = recovery.localization
+    record = {
+        'bad_frames': [i + 1 for i in found.bad],
+        'errors': {str(i + 1): v for i, v in found.errors.items()},
+        'rounds': found.rounds,
+        'compiles': found.compiles,
+        'preamble_error': found.preamble_error,
+        'fixed': [i + 1 for i in recovery.fixed],
+        'quarantined': [i + 1 for i in recovery.quarantined],
+        'elapsed_s': round(time.monotonic() - start, 3),
+    }
+    run_dir.mkdir(parents=True, exist_ok=True)
+    (run_dir / 'bisect.json').write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding='utf-8')
+    update_run_meta(run_dir, {'bisect': {k: record[k] for k in ('bad_frames', 'rounds', 'compiles',
+                                                                'quarantined', 'elapsed_s')}})
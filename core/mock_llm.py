@@ -0,0 +1,156 @@
+"""Offline ``mock`` LLM provider.
+
+Selected with ``llm.provider: mock``. Responses are canned Beamer derived
+deterministically from the prompt and paced by ``llm.mock.latency`` (seconds
+before the first token) and ``llm.mock.tokens_per_second``, so concurrency,
+batching and caching can be exercised without a paid API.
+"""
+import asyncio
+import hashlib
+import random
+import re
+import threading
+import time
+from typing import AsyncIterator, Iterator, Optional
+
+
+DEFAULT_MOCK = {
+    'latency': 0.5,            # seconds before the first token
+    'tokens_per_second': 200.0,
+    'chars_per_token': 4.0,
+    'chunk_tokens': 8,         # tokens per streamed chunk
+    'frames': 8,               # frames in a full-deck response
+    'fail_rate': 0.0,          # share of calls that fail with a retryable 429
+}
+
+SECTION_TITLE_RE = re.compile(r'\\section\*?\s*\{([^}]*)\}')
+
+# Calls seen per prompt digest. Failures are drawn from an RNG seeded by the
+# prompt and its attempt number, so they repeat from run to run however
+# concurrent calls and hedges interleave, and a retry can still succeed.
+_ATTEMPTS: dict = {}
+_ATTEMPTS_LOCK = threading.Lock()
+
+
+class MockRateLimitError(Exception):
+    status_code = 429
+
+
+def settings(cfg: dict) -> dict:
+    return {**DEFAULT_MOCK, **((cfg.get('llm') or {}).get('mock') or {})}
+
+
+def _frame(title: str, bullets: list) -> str:
+    items = '\n'.join(f'    \\item {b}' for b in bullets)
+    return f'\\begin{{frame}}{{{title}}}\n  \\begin{{itemize}}\n{items}\n  \\end{{itemize}}\n\\end{{frame}}'
+
+
+def mock_response(prompt, cfg: dict) -> str:
+    """Canned answer for ``prompt``: same prompt, same text."""
+    from core.generator import SECTIONS_MARKER
+
+    user = prompt.user
+    digest = hashlib.sha1(str(prompt).encode('utf-8')).hexdigest()[:8]
+
+    if '## Frame\n' in user:
+        frame = user.split('## Frame\n', 1)[1].strip()
+        return frame if '\\begin{frame}' in frame else _frame('Fixed frame', [frame[:80] or digest])
+
+    if SECTIONS_MARKER in user:
+        return '\n\n'.join([
+            '\\begin{frame}\n  \\titlepage\n\\end{frame}',
+            _frame('Outline', ['Motivation', 'Method', 'Experiments']),
+            SECTIONS_MARKER,
+            _frame('Conclusion', [f'Summary ({digest})', 'Limitations', 'Future work']),
+        ])
+
+    titles = SECTION_TITLE_RE.findall(user) or ['Overview']
+    count = max(1, int(settings(cfg)['frames']))
+    frames = []
+    for i in range(count):
+        title = titles[i % len(titles)].strip() or 'Section'
+        frames.append(_frame(f'{title} ({i + 1})', [f'Point {j + 1} of {title} [{digest}]' for j in range(3)]))
+    return '\n\n'.join(frames)
+
+
+def mock_usage(prompt, text: str, cfg: dict) -> dict:
+    ratio = float(settings(cfg)['chars_per_token'])
+    return {
+        'input_tokens': int((len(prompt.system) + len(prompt.user)) / ratio) + 1,
+        'cached_tokens': 0,
+        'cache_write_tokens': 0,
+        'output_tokens': int(len(text) / ratio) + 1,
+    }
+
+
+def _fails(prompt, fail_rate: float) -> bool:
+    digest = hashlib.sha1(str(prompt).encode('utf-8')).hexdigest()
+    with _ATTEMPTS_LOCK:
+        attempt = _ATTEMPTS.get(digest, 0)
+        _ATTEMPTS[digest] = attempt + 1
+    return random.Random(f'{digest}:{attempt}').random() < fail_rate
+
+
+def _plan(prompt, cfg: dict) -> tuple:
+    """``(text, chunks, first_delay, per_chunk_delay)`` for one call."""
+    opts = settings(cfg)
+    if opts['fail_rate'] and _fails(prompt, float(opts['fail_rate'])):
+        raise MockRateLimitError('mock provider: rate limited')
+    text = mock_response(prompt, cfg)
+    size = max(1, int(float(opts['chunk_tokens']) * float(opts['chars_per_token'])))
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+    tps = float(opts['tokens_per_second'])
+    per_chunk = float(opts['chunk_tokens']) / tps if tps > 0 else 0.0
+    return text, chunks, float(opts['latency']), per_chunk
+
+
+def _check(elapsed: float, timeout: Optional[float]) -> None:
+    if timeout is not None and elapsed > timeout:
+        raise TimeoutError('mock provider: request timed out')
+
+
+def call_mock(prompt, cfg: dict, timeout: Optional[float] = None) -> tuple:
+    text, chunks, first, per_chunk = _plan(prompt, cfg)
+    total = first + per_chunk * len(chunks)
+    time.sleep(min(total, timeout) if timeout is not None else total)
+    _check(total, timeout)
+    return text, mock_usage(prompt, text, cfg)
+
+
+def stream_mock(prompt, cfg: dict, timeout: Optional[float] = None,
+                usage: Optional[dict] = None) -> Iterator[str]:
+    text, chunks, first, per_chunk = _plan(prompt, cfg)
+    elapsed = first
+    _check(elapsed, timeout)
+    time.sleep(first)
+    for chunk in chunks:
+        # The timeout covers the whole call, not each chunk.
+        elapsed += per_chunk
+        _check(elapsed, timeout)
+        time.sleep(per_chunk)
+        yield chunk
+    if usage is not None:
+        usage.update(mock_usage(prompt, text, cfg))
+
+
+async def acall_mock(prompt, cfg: dict, timeout: Optional[float] = None) -> tuple:
+    text, chunks, first, per_chunk = _plan(prompt, cfg)
+    total = first + per_chunk * len(chunks)
+    await asyncio.sleep(min(total, timeout) if timeout is not None else total)
+    _check(total, timeout)
+    return text, mock_usage(prompt, text, cfg)
+
+
+async def astream_mock(prompt, cfg: dict, timeout: Optional[float] = None,
+                       usage: Optional[dict] = None) -> AsyncIterator[str]:
+    text, chunks, first, per_chunk = _plan(prompt, cfg)
+    elapsed = first
+    _check(elapsed, timeout)
+    await asyncio.sleep(first)
+    for chunk in chunks:
+        elapsed += per_chunk
+        _check(elapsed, timeout)
+        await asyncio.sleep(per_chunk)
+        yield chunk
+    if usage is not None:
+        usage.update(mock_usage(prompt, text, cfg))
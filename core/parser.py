@@ -1,82 +1,357 @@
+import json
 import re
+from bisect import bisect_right
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Optional
 
+from core.frames import FrameIndex
+from utils.disk_cache import hash_key, open_cache
 
-INCLUDE_PATTERNS = [
-    re.compile(r'\\input\{([^}]+)\}'),
-    re.compile(r'\\include\{([^}]+)\}'),
-    re.compile(r'\\subfile\{([^}]+)\}'),
-    re.compile(r'\\import\{([^}]+)\}\{([^}]+)\}'),
-]
+
+INCLUDE_RE = re.compile(r'\\(input|include|subfile|import|subimport)(?![A-Za-z@])')
+BRACE_ARG_RE = re.compile(r'\s*\{([^{}]*)\}')
+BARE_ARG_RE = re.compile(r'[ \t]*([^\s{}%\\]+)')
+
+DOCUMENTCLASS_RE = re.compile(r'^\s*\\documentclass\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}', re.MULTILINE)
+MAIN_NAME_HINTS = {'main', 'ms', 'paper', 'article', 'manuscript'}
+MAIN_PREFIX_BYTES = 64 * 1024
+
+# Bump when flattening output changes so cached artifacts are not reused.
+FLATTEN_VERSION = 1
+
+_STRIP_CACHE: dict = {}
+_STRIP_CACHE_SIZE = 1024
+_MAIN_CACHE: dict = {}
+_MAIN_CACHE_SIZE = 256
 
 
 def _read_tex(path: Path) -> str:
     return path.read_text(encoding='utf-8', errors='ignore')
 
 
-def _strip_comments(text: str) -> str:
+def _strip_comments_with_lines(text: str) -> tuple:
+    """Strip comments and return ``(text, lines)``.
+
+    ``lines[i]`` is the 0-based line number in the original text of line
+    ``i`` of the stripped text, since full-line comments are dropped.
+    """
     lines = []
-    for line in text.splitlines():
+    origin = []
+    for lineno, line in enumerate(text.splitlines()):
         stripped = line.lstrip()
         if stripped.startswith('%'):
             continue
         # Remove inline comments that are not escaped.
         line = re.sub(r'(?<!\\)%.*$', '', line)
         lines.append(line)
-    return '\n'.join(lines)
+        origin.append(lineno)
+    return '\n'.join(lines), origin
 
 
-def _resolve_path(base: Path, rel: str) -> Path:
-    if not rel.endswith('.tex'):
-        rel = rel + '.tex'
-    return (base / rel).resolve()
+def _strip_comments(text: str) -> str:
+    return _strip_comments_with_lines(text)[0]
 
 
-def _flatten(text: str, base: Path, seen: set) -> str:
-    text = _strip_comments(text)
+def _load_stripped(path: Path) -> tuple:
+    """Read and comment-strip ``path`` once per (mtime, size)."""
+    stat = path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _STRIP_CACHE.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    if len(_STRIP_CACHE) >= _STRIP_CACHE_SIZE:
+        _STRIP_CACHE.clear()
+    result = _strip_comments_with_lines(_read_tex(path))
+    _STRIP_CACHE[path] = (stamp, result)
+    return result
 
-    def repl(match):
-        if match.re == INCLUDE_PATTERNS[3]:
-            folder = match.group(1)
-            fname = match.group(2)
-            path = _resolve_path(base / folder, fname)
-        else:
-            path = _resolve_path(base, match.group(1))
 
-        if path in seen or not path.exists():
-            return ''
-        seen.add(path)
-        return _flatten(_read_tex(path), path.parent, seen)
+@dataclass
+class SourceMap:
+    """Maps offsets in flattened text back to the file and line they came from."""
 
-    changed = True
-    while changed:
-        changed = False
-        for pat in INCLUDE_PATTERNS:
-            new_text, n = pat.subn(repl, text)
-            if n > 0:
-                changed = True
-                text = new_text
-    return text
+    offsets: list = field(default_factory=list)
+    files: list = field(default_factory=list)
+    lines: list = field(default_factory=list)
+    line_tables: dict = field(default_factory=dict)
 
+    def add(self, out_offset: int, path: Path, stripped_line: int) -> None:
+        self.offsets.append(out_offset)
+        self.files.append(path)
+        self.lines.append(stripped_line)
+
+    def locate(self, text: str, offset: int) -> tuple:
+        """Return ``(path, 1-based line)`` for ``offset`` in ``text``."""
+        i = bisect_right(self.offsets, offset) - 1
+        if i < 0:
+            raise ValueError('Offset precedes the flattened text')
+        path = self.files[i]
+        stripped_line = self.lines[i] + text.count('\n', self.offsets[i], offset)
+        table = self.line_tables[path]
+        return path, table[min(stripped_line, len(table) - 1)] + 1 if table else 1
+
+
+@dataclass
+class FlattenResult:
+    text: str
+    main_file: Path
+    included: list
+    source_map: SourceMap
+
+    def locate(self, offset: int) -> tuple:
+        return self.source_map.locate(self.text, offset)
+
+
+class _Flattener:
+    """Expands includes in one linear pass over each file.
+
+    Every file is tokenized exactly once; included text is spliced in as
+    it is produced instead of being rescanned, so the cost is linear in the
+    total size of the tree.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.seen = set()
+        self.included = []
+        self.pieces = []
+        self.length = 0
+        self.source_map = SourceMap()
+
+    def _emit(self, text: str, path: Path, line: int) -> None:
+        if not text:
+            return
+        self.source_map.add(self.length, path, line)
+        self.pieces.append(text)
+        self.length += len(text)
+
+    def _find(self, rel: str, bases: list) -> Optional[Path]:
+        rel = rel.strip()
+        if not rel:
+            return None
+        names = [rel] if rel.endswith('.tex') else [rel + '.tex', rel]
+        for base in bases:
+            for name in names:
+                path = (base / name).resolve()
+                if path.is_file():
+                    return path
+        return None
+
+    def _parse_args(self, text: str, pos: int, command: str) -> tuple:
+        if command in ('import', 'subimport'):
+            first = BRACE_ARG_RE.match(text, pos)
+            second = BRACE_ARG_RE.match(text, first.end()) if first else None
+            if not second:
+                return None, pos
+            return (first.group(1), second.group(1)), second.end()
+        match = BRACE_ARG_RE.match(text, pos)
+        if match is None and command == 'input':
+            match = BARE_ARG_RE.match(text, pos)
+        if match is None:
+            return None, pos
+        return (match.group(1),), match.end()
+
+    def _open(self, path: Path, base: Path) -> list:
+        text, origin = _load_stripped(path)
+        self.source_map.line_tables[path] = origin
+        # [path, import base, text, scan iterator, emitted up to, line at that point]
+        return [path, base, text, INCLUDE_RE.finditer(text), 0, 0]
+
+    def expand(self, main_file: Path) -> None:
+        # An explicit stack instead of recursion keeps deeply nested trees
+        # safe from the interpreter recursion limit.
+        stack = [self._open(main_file, main_file.parent)]
+        while stack:
+            frame = stack[-1]
+            path, base, text, matches, pos, line = frame
+            for match in matches:
+                if match.start() < pos:
+                    continue
+                command = match.group(1)
+                args, end = self._parse_args(text, match.end(), command)
+                if args is None:
+                    continue
+
+                if command == 'import':
+                    new_base = (self.root / args[0]).resolve()
+                    target = self._find(args[1], [new_base])
+                elif command == 'subimport':
+                    new_base = (base / args[0]).resolve()
+                    target = self._find(args[1], [new_base])
+                else:
+                    new_base = base
+                    target = self._find(args[0], [base, self.root, path.parent])
+
+                self._emit(text[pos:match.start()], path, line)
+                line += text.count('\n', pos, end)
+                pos = end
+                if target is None or target in self.seen:
+                    continue
+                self.seen.add(target)
+                self.included.append(target)
+                frame[4], frame[5] = pos, line
+                stack.append(self._open(target, new_base))
+                break
+            else:
+                self._emit(text[pos:], path, line)
+                stack.pop()
+
+    def text(self) -> str:
+        return ''.join(self.pieces)
 
-def flatten_latex_tree(src_dir: Path) -> str:
-    main_candidates = list(src_dir.rglob('*.tex'))
-    if not main_candidates:
-        raise ValueError('No .tex files found')
 
-    main_file = None
-    for cand in main_candidates:
-        text = _read_tex(cand)
+def _flatten_file(main_file: Path) -> FlattenResult:
+    main_file = main_file.resolve()
+    flattener = _Flattener(main_file.parent)
+    flattener.seen.add(main_file)
+    flattener.expand(main_file)
+    return FlattenResult(
+        text=flattener.text(),
+        main_file=main_file,
+        included=flattener.included,
+        source_map=flattener.source_map,
+    )
+
+
+def _read_prefix(path: Path, limit: int = MAIN_PREFIX_BYTES) -> str:
+    with open(path, 'rb') as f:
+        return f.read(limit).decode('utf-8', errors='ignore')
+
+
+def _readme_hints(src_dir: Path) -> tuple:
+    """Return ``(toplevel, ignored)`` file names declared in arXiv's 00README."""
+    toplevel, ignored = [], set()
+    readme_json = src_dir / '00README.json'
+    if readme_json.is_file():
+        try:
+            sources = json.loads(readme_json.read_text(encoding='utf-8')).get('sources', [])
+        except (OSError, ValueError, AttributeError):
+            sources = []
+        for entry in sources:
+            if not isinstance(entry, dict):
+                continue
+            name, usage = entry.get('filename', ''), entry.get('usage', '')
+            if usage == 'toplevel':
+                toplevel.append(name)
+            elif usage == 'ignore':
+                ignored.add(name)
+    for legacy in sorted(src_dir.glob('00README.XXX')):
+        for line in legacy.read_text(encoding='utf-8', errors='ignore').splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1] == 'toplevelfile':
+                toplevel.append(parts[0])
+            elif len(parts) == 2 and parts[1] == 'ignore':
+                ignored.add(parts[0])
+    return toplevel, ignored
+
+
+def _tree_signature(src_dir: Path, files: list) -> tuple:
+    sig = []
+    for path in files:
+        stat = path.stat()
+        sig.append((path.relative_to(src_dir).as_posix(), stat.st_size, stat.st_mtime_ns))
+    return tuple(sig)
+
+
+def _score_main_candidates(src_dir: Path, candidates: list) -> list:
+    prefixes = {path: _strip_comments(_read_prefix(path)) for path in candidates}
+
+    included = {}
+    for text in prefixes.values():
+        for match in INCLUDE_RE.finditer(text):
+            arg = BRACE_ARG_RE.match(text, match.end()) or BARE_ARG_RE.match(text, match.end())
+            if arg is None:
+                continue
+            ref = arg.group(1).strip().replace('\\', '/')
+            if ref.endswith('.tex'):
+                ref = ref[:-4]
+            included[ref] = included.get(ref, 0) + 1
+
+    scored = []
+    for path in candidates:
+        text = prefixes[path]
+        rel = path.relative_to(src_dir)
+        score = 0
+        docclass = DOCUMENTCLASS_RE.search(text)
+        if docclass:
+            score += 2 if docclass.group(1) == 'standalone' else 10
         if '\\begin{document}' in text:
-            main_file = cand
-            break
+            score += 5
+        stem_parts = rel.with_suffix('').parts
+        score -= 8 * sum(included.get('/'.join(stem_parts[i:]), 0) for i in range(len(stem_parts)))
+        if rel.stem.lower() in MAIN_NAME_HINTS:
+            score += 1
+        scored.append((-score, len(rel.parts), rel.as_posix(), path))
+    scored.sort()
+    return scored
+
+
+def detect_main_file(src_dir: Path) -> Path:
+    """Pick the root ``.tex`` file of a source tree.
+
+    Honours arXiv's ``00README`` toplevel hints, otherwise scores each
+    candidate from a bounded prefix (``\\documentclass``, ``\\begin{document}``,
+    how often other files include it). The result is cached per tree until
+    any ``.tex`` file changes, and ties are broken deterministically.
+    """
+    candidates = sorted(src_dir.rglob('*.tex'))
+    if not candidates:
+        raise ValueError('No .tex files found')
+
+    key = src_dir.resolve()
+    signature = _tree_signature(src_dir, candidates + sorted(src_dir.glob('00README*')))
+    cached = _MAIN_CACHE.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    toplevel, ignored = _readme_hints(src_dir)
+    main_file = next((src_dir / name for name in toplevel if (src_dir / name).is_file()), None)
     if main_file is None:
-        main_file = main_candidates[0]
+        pool = [p for p in candidates if p.relative_to(src_dir).as_posix() not in ignored] or candidates
+        main_file = _score_main_candidates(src_dir, pool)[0][3]
+
+    if len(_MAIN_CACHE) >= _MAIN_CACHE_SIZE:
+        _MAIN_CACHE.clear()
+    _MAIN_CACHE[key] = (signature, main_file)
+    return main_file
+
+
+def resolve_latex_tree(src_dir: Path) -> FlattenResult:
+    return _flatten_file(detect_main_file(src_dir))
+
+
+def _tree_manifest_key(src_dir: Path) -> str:
+    # Every file takes part, not just .tex: \input{table.tikz} and friends
+    # can pull in other extensions, and stat() is cheap next to parsing.
+    files = sorted(p for p in src_dir.rglob('*') if p.is_file())
+    return hash_key('flatten', FLATTEN_VERSION, *_tree_signature(src_dir, files))
+
+
+def flatten_latex_tree(src_dir: Path, cfg: Optional[dict] = None) -> str:
+    cache = open_cache(cfg, 'flatten', default_mb=256)
+    if cache is None:
+        return resolve_latex_tree(src_dir).text
+
+    key = _tree_manifest_key(src_dir)
+    entry = cache.get(key)
+    if entry is not None:
+        try:
+            return (entry / 'paper.tex').read_text(encoding='utf-8')
+        except OSError:
+            cache.discard(key)
 
-    seen = {main_file}
-    return _flatten(_read_tex(main_file), main_file.parent, seen)
+    result = resolve_latex_tree(src_dir)
+    root = src_dir.resolve()
+    staging = cache.staging_dir()
+    (staging / 'paper.tex').write_text(result.text, encoding='utf-8')
+    cache.commit(key, staging, {
+        'main_file': result.main_file.relative_to(root).as_posix(),
+        'included': [p.relative_to(root).as_posix() for p in result.included if p.is_relative_to(root)],
+        'chars': len(result.text),
+    })
+    return result.text
 
 
 def extract_frames(body_tex: str) -> list[str]:
-    pattern = re.compile(r'\\begin\{frame\}.*?\\end\{frame\}', re.DOTALL)
-    return pattern.findall(body_tex)
+    return list(FrameIndex(body_tex))
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import weakref
+from typing import Optional
+
+
+DEEPSEEK_BASE_URL = 'https://api.deepseek.com'
+
+DEFAULT_HTTP = {
+    'timeout': 600.0,
+    'connect_timeout': 10.0,
+    'max_connections': 20,
+    'max_keepalive_connections': 10,
+    'keepalive_expiry': 60.0,
+}
+
+# Module-level so clients survive Streamlit reruns, which re-execute app.py
+# but keep imported modules alive.
+_CLIENTS: dict = {}
+_LOCK = threading.Lock()
+# Async clients hold connections bound to one event loop, so they are pooled
+# per loop and dropped with it.
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()
+
+
+def _base_url(provider: str, llm: dict) -> str:
+    base_url = llm.get('base_url') or ''
+    if provider == 'deepseek' and not base_url:
+        return DEEPSEEK_BASE_URL
+    return base_url
+
+
+def _http_settings(llm: dict) -> tuple:
+    http_cfg = llm.get('http') or {}
+    return tuple((k, float(http_cfg.get(k, v))) for k, v in sorted(DEFAULT_HTTP.items()))
+
+
+def _build_http_client(settings: dict, is_async: bool = False):
+    # Both SDKs sit on httpx; an explicit client lets us size the
+    # keep-alive pool. Without httpx the SDK default pool is still reused
+    # because the SDK client itself is cached.
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return (httpx.AsyncClient if is_async else httpx.Client)(
+        timeout=httpx.Timeout(settings['timeout'], connect=settings['connect_timeout']),
+        limits=httpx.Limits(
+            max_connections=int(settings['max_connections']),
+            max_keepalive_connections=int(settings['max_keepalive_connections']),
+            keepalive_expiry=settings['keepalive_expiry'],
+        ),
+    )
+
+
+def _build_client(provider: str, base_url: str, api_key: str, settings: dict, is_async: bool = False):
+    # SDK-level retries are off: core.resilience retries with backoff under
+    # a per-call deadline, which the SDK's own retries would overrun.
+    kwargs = {'api_key': api_key, 'timeout': settings['timeout'], 'max_retries': 0}
+    if base_url:
+        kwargs['base_url'] = base_url
+    http_client = _build_http_client(settings, is_async)
+    if http_client is not None:
+        kwargs['http_client'] = http_client
+
+    if provider in ('openai', 'deepseek'):
+        try:
+            from openai import AsyncOpenAI, OpenAI
+        except Exception as exc:
+            raise RuntimeError('openai package is required') from exc
+        return (AsyncOpenAI if is_async else OpenAI)(**kwargs)
+
+    if provider == 'anthropic':
+        try:
+            import anthropic
+        except Exception as exc:
+            raise RuntimeError('anthropic package is required') from exc
+        return (anthropic.AsyncAnthropic if is_async else anthropic.Anthropic)(**kwargs)
+
+    raise ValueError('Unsupported LLM provider')
+
+
+def get_client(cfg: dict, provider: Optional[str] = None):
+    """Return the shared SDK client for ``(provider, base_url, api_key)``.
+
+    One client, and with it one keep-alive connection pool, is built per
+    key and reused by every later call. Changing the ``llm.http`` settings
+    builds a fresh client.
+    """
+    llm = cfg['llm']
+    provider = provider or llm['provider']
+    base_url = _base_url(provider, llm)
+    settings = _http_settings(llm)
+    key = (provider, base_url, llm.get('api_key', ''), settings)
+
+    client = _CLIENTS.get(key)
+    if client is not None:
+        return client
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = _build_client(provider, base_url, llm.get('api_key', ''), dict(settings))
+            _CLIENTS[key] = client
+    return client
+
+
+def get_async_client(cfg: dict, provider: Optional[str] = None):
+    """Async counterpart of :func:`get_client`, shared within the running event loop."""
+    llm = cfg['llm']
+    provider = provider or llm['provider']
+    base_url = _base_url(provider, llm)
+    settings = _http_settings(llm)
+    key = (provider, base_url, llm.get('api_key', ''), settings)
+
+    loop = asyncio.get_running_loop()
+    with _LOCK:
+        clients = _ASYNC_CLIENTS.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = _build_client(provider, base_url, llm.get('api_key', ''), dict(settings), is_async=True)
+            clients[key] = client
+    return client
+
+
+def close_clients() -> None:
+    with _LOCK:
+        for client in _CLIENTS.values():
+            close = getattr(client, 'close', None)
+            if close is not None:
+                close()
+        _CLIENTS.clear()
@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+from tenacity import AsyncRetrying, Retrying, retry_if_exception, stop_after_attempt, stop_after_delay
+
+from utils.run_meta import bump_run_counters
+
+
+DEFAULT_RETRY = {
+    'attempts': 4,
+    'initial_wait': 1.0,
+    'max_wait': 30.0,
+    'deadline': 300.0,
+}
+DEFAULT_HEDGE = {
+    'enabled': False,
+    'percentile': 90,
+    'min_samples': 10,
+    'delay': 45.0,
+}
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# Module-level so latency history and the hedge pool survive Streamlit reruns.
+# Losing hedge legs keep running here until their HTTP call returns; their
+# results are discarded.
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix='llm-hedge')
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per ``(provider, model)``."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: tuple, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, key: tuple, pct: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        rank = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[rank]
+
+
+LATENCY = LatencyTracker()
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    code = getattr(exc, 'status_code', None)
+    if code is None:
+        code = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return code if isinstance(code, int) else None
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a ``Retry-After`` / ``retry-after-ms`` header, if any."""
+    headers = getattr(getattr(exc, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, DeadlineExceeded):
+        return False
+    code = _status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS
+    # SDK connection/timeout errors carry no status code.
+    name = exc.__class__.__name__
+    return isinstance(exc, (ConnectionError, TimeoutError)) or 'Timeout' in name or 'Connection' in name
+
+
+def retry_settings(cfg: dict) -> dict:
+    return {**DEFAULT_RETRY, **((cfg.get('llm') or {}).get('retry') or {})}
+
+
+def hedge_settings(cfg: dict) -> dict:
+    return {**DEFAULT_HEDGE, **((cfg.get('llm') or {}).get('hedge') or {})}
+
+
+def _retry_policy(cfg: dict, run_dir: Optional[Path], deadline: Optional[float], stats: Optional[dict]) -> tuple:
+    """Shared tenacity arguments and the deadline check for sync and async retries."""
+    settings = retry_settings(cfg)
+    budget = float(settings['deadline'])
+    deadline = deadline or time.monotonic() + budget
+
+    def wait_time(state) -> float:
+        exp = min(float(settings['max_wait']), float(settings['initial_wait']) * 2 ** (state.attempt_number - 1))
+        exc = state.outcome.exception()
+        delay = max(exp, retry_after(exc) or 0.0)
+        if time.monotonic() + delay >= deadline:
+            raise DeadlineExceeded(f'LLM call deadline of {budget:g}s exceeded') from exc
+        return delay
+
+    def before_sleep(state) -> None:
+        if stats is not None:
+            stats['retries'] = stats.get('retries', 0) + 1
+        if run_dir:
+            bump_run_counters(run_dir, 'llm_resilience', retries=1)
+
+    def remaining() -> float:
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise DeadlineExceeded(f'LLM call deadline of {budget:g}s exceeded')
+        return left
+
+    kwargs = {
+        'stop': stop_after_attempt(int(settings['attempts'])) | stop_after_delay(budget),
+        'wait': wait_time,
+        'retry': retry_if_exception(is_retryable),
+        'before_sleep': before_sleep,
+        'reraise': True,
+    }
+    return kwargs, remaining
+
+
+def call_with_retry(fn: Callable[[float], str], cfg: dict, run_dir: Optional[Path] = None,
+                    deadline: Optional[float] = None, stats: Optional[dict] = None) -> str:
+    """Run ``fn(timeout)`` with exponential backoff under a per-call deadline.
+
+    ``fn`` receives the seconds left before the deadline and should pass them
+    to the SDK as its request timeout. Waits grow exponentially from
+    ``llm.retry.initial_wait`` up to ``max_wait``, but never undercut a
+    server's ``Retry-After``; a wait that would cross the deadline raises
+    :class:`DeadlineExceeded` instead of sleeping. Retries are also counted
+    in ``stats['retries']`` when a per-call record is given.
+    """
+    kwargs, remaining = _retry_policy(cfg, run_dir, deadline, stats)
+    return Retrying(**kwargs)(lambda: fn(remaining()))
+
+
+async def acall_with_retry(fn: Callable[[float], Awaitable], cfg: dict, run_dir: Optional[Path] = None,
+                           deadline: Optional[float] = None, stats: Optional[dict] = None):
+    """Async :func:`call_with_retry`: awaits ``fn(timeout)`` and sleeps without blocking the loop."""
+    kwargs, remaining = _retry_policy(cfg, run_dir, deadline, stats)
+
+    async def attempt():
+        return await fn(remaining())
+
+    return await AsyncRetrying(**kwargs)(attempt)
+
+
+def hedged_call(primary: Callable[[], str], backup: Optional[Callable[[], str]], delay: Optional[float],
+                run_dir: Optional[Path] = None, stats: Optional[dict] = None) -> str:
+    """Run ``primary``; if it is still running after ``delay`` seconds, also
+    start ``backup`` and return whichever succeeds first.
+
+    If the first leg to finish fails, the other one is awaited; the error is
+    only raised when both legs fail.
+    """
+    first = _HEDGE_POOL.submit(primary)
+    if backup is None or delay is None:
+        return first.result()
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    if stats is not None:
+        stats['hedged'] = True
+    if run_dir:
+        bump_run_counters(run_dir, 'llm_resilience', hedged=1)
+    second = _HEDGE_POOL.submit(backup)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second and run_dir:
+                    bump_run_counters(run_dir, 'llm_resilience', hedge_wins=1)
+                return future.result()
+            error = error or future.exception()
+    raise error
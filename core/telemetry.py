@@ -0,0 +1,222 @@
+"""Per-call LLM instrumentation and a cross-run report.
+
+Every call through ``core.generator`` appends one JSON line to
+``run_dir/llm_calls.jsonl`` and adds its totals to ``meta.json``. The report
+aggregates those files across every run under ``runs_root``:
+
+    python -m core.telemetry [--runs-root runs] [--by model kind prompt_version]
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+from utils.run_meta import bump_run_counters
+
+
+CALLS_NAME = 'llm_calls.jsonl'
+GROUP_FIELDS = ('provider', 'model', 'kind', 'prompt_version')
+
+_LOCK = threading.Lock()
+
+
+def prompt_version(prompt) -> str:
+    """Short digest of the AGENTS.md rules, without the paper context sections mode adds."""
+    rules = prompt.rules or prompt.system
+    return hashlib.sha1(rules.encode('utf-8')).hexdigest()[:10]
+
+
+def start_call(kind: str, prompt, cfg: dict, stream: bool = False) -> dict:
+    llm = cfg['llm']
+    return {
+        'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'kind': kind,
+        'provider': llm['provider'],
+        'model': llm.get('model', ''),
+        'prompt_version': prompt_version(prompt),
+        'prompt_chars': len(prompt.system) + len(prompt.user),
+        'stream': stream,
+        'response_cache': False,
+        'retries': 0,
+        'hedged': False,
+        'answered_by': '',
+        'input_tokens': 0,
+        'cached_tokens': 0,
+        'cache_write_tokens': 0,
+        'output_tokens': 0,
+        'ttft_s': None,
+        'latency_s': None,
+        'cost_usd': None,
+        'error': '',
+        '_start': time.monotonic(),
+    }
+
+
+def mark_first_token(record: dict) -> None:
+    if record['ttft_s'] is None:
+        record['ttft_s'] = round(time.monotonic() - record['_start'], 3)
+
+
+def estimate_cost(record: dict, cfg: dict) -> Optional[float]:
+    """USD cost from ``llm.prices`` (per million tokens); None for unknown models."""
+    model = (record['answered_by'] or '').partition('/')[2] or record['model']
+    price = ((cfg.get('llm') or {}).get('prices') or {}).get(model)
+    if not price:
+        return None
+    uncached = record['input_tokens'] - record['cached_tokens'] - record['cache_write_tokens']
+    cost = (
+        uncached * price.get('input', 0)
+        + record['cached_tokens'] * price.get('cached_input', price.get('input', 0))
+        + record['cache_write_tokens'] * price.get('cache_write', price.get('input', 0))
+        + record['output_tokens'] * price.get('output', 0)
+    )
+    return round(cost / 1e6, 6)
+
+
+def finish_call(run_dir: Optional[Path], record: dict, cfg: dict, usage: Optional[dict] = None,
+                error: Optional[BaseException] = None) -> dict:
+    """Complete ``record``, append it to ``llm_calls.jsonl`` and update ``meta.json``.
+
+    ``llm_tokens`` keeps the provider token counts and ``llm_calls`` the call
+    count, errors, retries, hedges and summed latency/cost.
+    """
+    record['latency_s'] = round(time.monotonic() - record.pop('_start'), 3)
+    if usage:
+        for name in ('input_tokens', 'cached_tokens', 'cache_write_tokens', 'output_tokens'):
+            record[name] = usage.get(name, 0)
+        record['answered_by'] = f"{usage.get('provider', record['provider'])}/{usage.get('model', record['model'])}"
+    if error is not None:
+        record['error'] = str(error) or error.__class__.__name__
+    if not record['response_cache'] and not record['error']:
+        record['cost_usd'] = estimate_cost(record, cfg)
+    if not run_dir:
+        return record
+
+    with _LOCK:
+        run_dir.mkdir(parents=True, exist_ok=True)
+        with (run_dir / CALLS_NAME).open('a', encoding='utf-8') as fh:
+            fh.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    if usage:
+        bump_run_counters(
+            run_dir, 'llm_tokens',
+            calls=1,
+            input=record['input_tokens'],
+            cached=record['cached_tokens'],
+            uncached=record['input_tokens'] - record['cached_tokens'] - record['cache_write_tokens'],
+            cache_write=record['cache_write_tokens'],
+            output=record['output_tokens'],
+        )
+    bump_run_counters(
+        run_dir, 'llm_calls',
+        calls=1,
+        errors=int(bool(record['error'])),
+        response_cache_hits=int(record['response_cache']),
+        retries=record['retries'],
+        hedged=int(record['hedged']),
+        latency_s=record['latency_s'],
+        cost_usd=record['cost_usd'] or 0.0,
+    )
+    return record
+
+
+def load_calls(runs_root: Path) -> list:
+    records = []
+    for path in sorted(runs_root.glob(f'*/{CALLS_NAME}')):
+        with path.open(encoding='utf-8') as fh:
+            for line in fh:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                record['run'] = path.parent.name
+                records.append(record)
+    return records
+
+
+def _percentile(values: list, pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def summarize(records: list, by: tuple = ('provider', 'model')) -> list:
+    """Aggregate call records into one row per distinct ``by`` key."""
+    groups: dict = {}
+    for record in records:
+        groups.setdefault(tuple(record.get(f, '') for f in by), []).append(record)
+
+    rows = []
+    for key, group in sorted(groups.items()):
+        live = [r for r in group if not r.get('response_cache') and not r.get('error')]
+        latencies = [r['latency_s'] for r in live if r.get('latency_s') is not None]
+        ttfts = [r['ttft_s'] for r in live if r.get('ttft_s') is not None]
+        input_tokens = sum(r.get('input_tokens', 0) for r in live)
+        cached = sum(r.get('cached_tokens', 0) for r in live)
+        costs = [r['cost_usd'] for r in live if r.get('cost_usd') is not None]
+        rows.append({
+            **dict(zip(by, key)),
+            'calls': len(group),
+            'runs': len({r['run'] for r in group if 'run' in r}),
+            'errors': sum(1 for r in group if r.get('error')),
+            'cache_hits': sum(1 for r in group if r.get('response_cache')),
+            'retries': sum(r.get('retries', 0) for r in group),
+            'hedged': sum(1 for r in group if r.get('hedged')),
+            'p50_s': _percentile(latencies, 50),
+            'p95_s': _percentile(latencies, 95),
+            'max_s': max(latencies) if latencies else None,
+            'ttft_p50_s': _percentile(ttfts, 50),
+            'input_tokens': input_tokens,
+            'cached_pct': round(100.0 * cached / input_tokens, 1) if input_tokens else None,
+            'output_tokens': sum(r.get('output_tokens', 0) for r in live),
+            'cost_usd': round(sum(costs), 4) if costs else None,
+        })
+    return rows
+
+
+def _fmt(value) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, float):
+        return f'{value:.4g}'
+    return str(value)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description='Aggregate LLM call records across runs.')
+    ap.add_argument('--config', default='config.yaml')
+    ap.add_argument('--runs-root', help='defaults to app.runs_root from the config')
+    ap.add_argument('--by', nargs='+', default=['provider', 'model'], choices=GROUP_FIELDS)
+    ap.add_argument('--json', action='store_true', help='print rows as JSON')
+    args = ap.parse_args()
+
+    runs_root = args.runs_root
+    if not runs_root:
+        cfg = yaml.safe_load(Path(args.config).read_text(encoding='utf-8'))
+        runs_root = cfg['app']['runs_root']
+    rows = summarize(load_calls(Path(runs_root)), tuple(args.by))
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    if not rows:
+        print(f'No {CALLS_NAME} found under {runs_root}')
+        return
+    columns = list(rows[0])
+    widths = [max(len(c), *(len(_fmt(r[c])) for r in rows)) for c in columns]
+    print('  '.join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(_fmt(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+ENTRY_META = 'entry.json'
+
+_LOCK = threading.Lock()
+
+# sha256 of files keyed by (path, size, mtime), shared by every cache key
+# that hashes input files; bounded so long-running servers do not grow it.
+_FILE_HASHES: OrderedDict = OrderedDict()
+_FILE_HASHES_MAX = 4096
+_FILE_HASHES_LOCK = threading.Lock()
+
+
+def hash_key(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            h.update(part)
+        else:
+            h.update(str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def file_sha256(path: Path, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def memo_file_sha256(path: Path) -> str:
+    """:func:`file_sha256`, remembered until the file's size or mtime changes."""
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    with _FILE_HASHES_LOCK:
+        digest = _FILE_HASHES.get(key)
+        if digest is not None:
+            _FILE_HASHES.move_to_end(key)
+            return digest
+    digest = file_sha256(path)
+    with _FILE_HASHES_LOCK:
+        _FILE_HASHES[key] = digest
+        if len(_FILE_HASHES) > _FILE_HASHES_MAX:
+            _FILE_HASHES.popitem(last=False)
+    return digest
+
+
+def tree_size(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob('*') if p.is_file())
+
+
+class DiskCache:
+    """Directory-per-entry cache with a size cap and LRU eviction.
+
+    Every entry lives in ``<root>/<namespace>/<key[:2]>/<key>/`` and is only
+    visible once its ``entry.json`` exists, so half-written entries are never
+    returned. The mtime of ``entry.json`` doubles as the last-access time.
+    """
+
+    def __init__(self, root: Path, namespace: str, max_bytes: int):
+        self.root = Path(root) / namespace
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> Optional[Path]:
+        entry = self._entry_dir(key)
+        meta_path = entry / ENTRY_META
+        if not meta_path.exists():
+            return None
+        try:
+            os.utime(meta_path)
+        except OSError:
+            return None
+        return entry
+
+    def meta(self, key: str) -> dict:
+        meta_path = self._entry_dir(key) / ENTRY_META
+        try:
+            return json.loads(meta_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return {}
+
+    def staging_dir(self) -> Path:
+        tmp = self.root / '.tmp' / uuid.uuid4().hex
+        tmp.mkdir(parents=True)
+        return tmp
+
+    def commit(self, key: str, staging: Path, meta: Optional[dict] = None) -> Path:
+        meta = dict(meta or {})
+        meta['key'] = key
+        meta['size'] = tree_size(staging)
+        meta['created'] = time.time()
+        (staging / ENTRY_META).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+
+        entry = self._entry_dir(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        with _LOCK:
+            if entry.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(staging, entry)
+        self.evict()
+        return entry
+
+    def discard(self, key: str) -> None:
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def evict(self) -> None:
+        with _LOCK:
+            entries = []
+            total = 0
+            for meta_path in self.root.glob(f'*/*/{ENTRY_META}'):
+                try:
+                    size = json.loads(meta_path.read_text(encoding='utf-8')).get('size', 0)
+                    atime = meta_path.stat().st_mtime
+                except (OSError, ValueError):
+                    continue
+                entries.append((atime, size, meta_path.parent))
+                total += size
+
+            entries.sort()
+            for _, size, entry in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+
+
+def open_cache(cfg: Optional[dict], namespace: str, default_mb: int = 1024) -> Optional[DiskCache]:
+    cache_cfg = (cfg or {}).get('cache') or {}
+    if not cache_cfg or not cache_cfg.get('enabled', True):
+        return None
+    max_mb = cache_cfg.get(f'{namespace}_max_mb', default_mb)
+    return DiskCache(Path(cache_cfg.get('root', 'cache')), namespace, int(max_mb) * 1024 * 1024)
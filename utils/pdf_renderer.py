@@ -1,12 +1,39 @@
-from typing import List
+import os
+from pathlib import Path
+from typing import List, Optional
 import fitz  # PyMuPDF
 
 
-def render_pdf_pages(pdf_path, dpi: int = 150) -> List[bytes]:
+def render_pdf_pages(pdf_path, dpi: int = 150, pages: Optional[List[int]] = None) -> List[bytes]:
     doc = fitz.open(pdf_path)
     images = []
-    for page in doc:
-        mat = fitz.Matrix(dpi / 72.0, dpi / 72.0)
-        pix = page.get_pixmap(matrix=mat)
+    mat = fitz.Matrix(dpi / 72.0, dpi / 72.0)
+    # pages: 只渲染指定页（支持负索引），默认渲染全部
+    indices = range(len(doc)) if pages is None else [p % len(doc) for p in pages]
+    for i in indices:
+        pix = doc[i].get_pixmap(matrix=mat)
         images.append(pix.tobytes('png'))
+    doc.close()
     return images
+
+
+def page_count(pdf_path) -> int:
+    doc = fitz.open(pdf_path)
+    count = len(doc)
+    doc.close()
+    return count
+
+
+def replace_pdf_pages(pdf_path, first: int, last: int, src_path) -> None:
+    """Replace pages ``first..last`` (1-based, inclusive) of ``pdf_path`` with all pages of ``src_path``."""
+    pdf_path = Path(pdf_path)
+    doc = fitz.open(pdf_path)
+    src = fitz.open(src_path)
+    doc.delete_pages(from_page=first - 1, to_page=last - 1)
+    doc.insert_pdf(src, start_at=first - 1)
+    src.close()
+    # 先写临时文件再替换，避免读者看到写了一半的PDF
+    tmp = pdf_path.with_name(pdf_path.name + '.tmp')
+    doc.save(tmp, garbage=1, deflate=True)
+    doc.close()
+    os.replace(tmp, pdf_path)
@@ -0,0 +1,26 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Space calls evenly so no more than ``rpm`` start in any minute.
+
+    Thread-safe: each :meth:`acquire` reserves the next free slot under the
+    lock and sleeps outside it, so concurrent callers queue up instead of
+    bursting. ``rpm <= 0`` disables limiting.
+    """
+
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm and rpm > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
@@ -0,0 +1,41 @@
+import json
+import threading
+from pathlib import Path
+
+
+META_NAME = 'meta.json'
+
+_LOCK = threading.Lock()
+
+
+def load_run_meta(run_dir: Path) -> dict:
+    try:
+        return json.loads((run_dir / META_NAME).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(run_dir: Path, meta: dict) -> None:
+    run_dir.mkdir(parents=True, exist_ok=True)
+    (run_dir / META_NAME).write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding='utf-8')
+
+
+def update_run_meta(run_dir: Path, updates: dict) -> dict:
+    """Merge ``updates`` into ``run_dir/meta.json`` (top-level keys replace)."""
+    with _LOCK:
+        meta = load_run_meta(run_dir)
+        meta.update(updates)
+        _write(run_dir, meta)
+        return meta
+
+
+def bump_run_counters(run_dir: Path, section: str, **deltas) -> None:
+    """Add ``deltas`` to the counters under ``meta[section]``; safe across threads."""
+    with _LOCK:
+        meta = load_run_meta(run_dir)
+        counters = meta.setdefault(section, {})
+        for name, delta in deltas.items():
+            total = counters.get(name, 0) + delta
+            # Keep summed seconds/costs readable instead of 0.9689999999999999.
+            counters[name] = round(total, 6) if isinstance(total, float) else total
+        _write(run_dir, meta)